@@ -0,0 +1,113 @@
+import logging
+from datetime import datetime
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from broadcast import RateLimiter, fan_out
+
+logger = logging.getLogger(__name__)
+
+
+# schedule_time ni triggerga aylantirish:
+#   "HH:MM"             — har kuni shu vaqtda
+#   "YYYY-MM-DD HH:MM"  — shu vaqtdan boshlab har kuni
+#   bo'sh               — har soatda (eski xatti-harakat)
+def make_trigger(schedule_time: str):
+    value = (schedule_time or '').strip()
+    if not value:
+        return IntervalTrigger(hours=1)
+    try:
+        hour, minute = (int(x) for x in value.split(':'))
+        return CronTrigger(hour=hour, minute=minute)
+    except ValueError:
+        pass
+    start = datetime.fromisoformat(value)
+    return IntervalTrigger(days=1, start_date=start)
+
+
+def ad_markup(button_text: str, button_url: str):
+    if not button_text or not button_url:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=button_text, url=button_url)]])
+
+
+# Har bir reklama — alohida scheduler vazifasi
+class AdScheduler:
+    # get_scheduler — scheduler ni kerak bo'lganda yaratib beruvchi funksiya
+    def __init__(self, bot, db, get_scheduler, limiter: RateLimiter):
+        self.bot = bot
+        self.db = db
+        self.get_scheduler = get_scheduler
+        self.limiter = limiter
+        # Noto'g'ri schedule_time li (ad_id, schedule_time) juftlari — har sync da ogohlantirmaslik uchun
+        self._rejected = set()
+
+    @property
+    def scheduler(self):
+        return self.get_scheduler()
+
+    @staticmethod
+    def job_id(ad_id: int) -> str:
+        return f"ad:{ad_id}"
+
+    # Reklamani ro'yxatga olish (bor bo'lsa yangilanadi)
+    def schedule(self, ad):
+        ad_id, schedule_time = ad[0], ad[5]
+        try:
+            trigger = make_trigger(schedule_time)
+        except ValueError:
+            if (ad_id, schedule_time) not in self._rejected:
+                self._rejected.add((ad_id, schedule_time))
+                logger.warning("Reklama #%s: noto'g'ri schedule_time %r", ad_id, schedule_time)
+            return
+        self.scheduler.add_job(
+            self.run, trigger, args=(ad_id,), kwargs={'schedule_time': schedule_time}, id=self.job_id(ad_id),
+            replace_existing=True, max_instances=1, coalesce=True, misfire_grace_time=300,
+        )
+
+    def unschedule(self, ad_id: int):
+        job = self.scheduler.get_job(self.job_id(ad_id))
+        if job is not None:
+            job.remove()
+
+    # Bazadagi reklamalar bilan vazifalarni moslashtirish
+    async def sync(self):
+        ads = await self.db.get_scheduled_ads()
+        active = set()
+        # o'chirilgan yoki tuzatilgan reklamalar juftlari unutiladi
+        self._rejected &= {(ad[0], ad[5]) for ad in ads}
+        for ad in ads:
+            active.add(self.job_id(ad[0]))
+            if (ad[0], ad[5]) in self._rejected:
+                continue
+            job = self.scheduler.get_job(self.job_id(ad[0]))
+            # trigger o'zgarmagan bo'lsa, keyingi ishga tushish vaqtini saqlab qolamiz
+            if job is None or job.kwargs.get('schedule_time') != ad[5]:
+                self.schedule(ad)
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith('ad:') and job.id not in active:
+                job.remove()
+
+    # schedule_time faqat sync() trigger o'zgarganini bilishi uchun saqlanadi
+    async def run(self, ad_id: int, schedule_time: str = None):
+        ad = await self.db.get_ad(ad_id)
+        if ad is None or not ad[6] or ad[6] <= 0:
+            self.unschedule(ad_id)
+            return
+        _, image_file_id, text, btn_text, btn_url, _, _ = ad
+        markup = ad_markup(btn_text, btn_url)
+
+        async def send(chat_id):
+            if image_file_id:
+                await self.bot.send_photo(chat_id, image_file_id, caption=text, reply_markup=markup)
+            else:
+                await self.bot.send_message(chat_id, text, reply_markup=markup)
+
+        counts = await fan_out(self.db, self.limiter, send)
+        # repeat_count faqat to'liq yuborilgandan keyin kamaytiriladi
+        remaining = await self.db.decrement_ad_count(ad_id)
+        logger.info("Reklama #%s yuborildi: %s, qoldi: %s", ad_id, counts, remaining)
+        if remaining <= 0:
+            self.unschedule(ad_id)
@@ -0,0 +1,325 @@
+# Oflayn yuklama testi: dp ga sintetik Update lar beriladi, Telegram API o'rniga
+# tarmoqsiz stub sessiya ishlaydi. Oldindan to'ldirilgan baza ustida:
+#   codes     — kino kodlari (Zipf bo'yicha ommabop kinolar ko'proq so'raladi)
+#   start     — /start to'lqini (yangi va qaytgan foydalanuvchilar)
+#   search    — /search so'rovlari
+#   broadcast — barcha foydalanuvchilarga ommaviy xabar
+# Har bir handler uchun p50/p99 kechikish, o'tkazuvchanlik va SQLite vaqti chiqariladi.
+#
+# Foydalanish: python bench.py --movies 20000 --users 50000 --requests 5000 > bench_output.txt
+import argparse
+import asyncio
+import contextvars
+import datetime
+import inspect
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+_WORDS = (
+    'qora', 'oq', 'tun', 'kun', 'yulduz', 'dengiz', 'tog', 'shahar', 'sevgi', 'urush', 'qasos', 'sir',
+    'oxirgi', 'birinchi', 'yangi', 'eski', 'oltin', 'temir', 'olov', 'muz', 'shamol', 'bahor', 'kuz',
+    'avatar', 'inception', 'matrix', 'titanic', 'gladiator', 'joker', 'batman', 'alien', 'predator',
+    'kapitan', 'qirol', 'malika', 'ota', 'ona', 'aka', 'uka', 'do\'st', 'dushman', 'yo\'l', 'uy', 'bog',
+    'кино', 'тун', 'юлдуз', 'денгиз', 'севги', 'қасос', 'шаҳар', 'олтин', 'шамол', 'баҳор',
+)
+_FORMATS = ('mp4', 'mkv', 'avi')
+_LANGUAGES = ('O\'zbek', 'Rus', 'English')
+_ADMIN_ID = 1
+_USER_BASE = 10_000
+
+# Joriy update uchun o'lchovlar (har bir update o'z vazifasida, o'z kontekstida)
+_probe = contextvars.ContextVar('bench_probe', default=None)
+
+
+class _Probe:
+    __slots__ = ('handler', 'latency', 'db_time', 'db_calls', 'in_db')
+
+    def __init__(self):
+        self.handler = 'unhandled'
+        self.latency = 0.0
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.in_db = False
+
+
+def _quantile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# Telegram API o'rniga: chaqiruvlarni sanaydi, kerak bo'lsa tarmoq kechikishini taqlid qiladi
+def make_session(latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message, MessageId
+
+    class StubSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.latency = latency
+            self.calls = Counter()
+            self._message_id = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            returning = method.__returning__
+            if returning is MessageId:
+                return MessageId(message_id=1)
+            if returning is Message:
+                self._message_id += 1
+                chat_id = getattr(method, 'chat_id', 0)
+                return Message(
+                    message_id=self._message_id, date=datetime.datetime.now(),
+                    chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type='private'),
+                )
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b''
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+
+# Database ning ochiq korutinalarini o'rab, joriy update ning SQLite vaqtini yig'ish
+# (ulanish/yozish qulfini kutish ham shu vaqtga kiradi)
+def instrument_db(db):
+    def timed(fn):
+        async def wrapper(*args, **kwargs):
+            probe = _probe.get()
+            if probe is None or probe.in_db:
+                return await fn(*args, **kwargs)
+            probe.in_db = True
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                probe.db_time += time.perf_counter() - start
+                probe.db_calls += 1
+                probe.in_db = False
+        return wrapper
+
+    # faqat klass metodlari (on_new_users kabi instance atributlari — baza emas)
+    for name, _ in inspect.getmembers(type(db), inspect.iscoroutinefunction):
+        if not name.startswith('_'):
+            setattr(db, name, timed(getattr(db, name)))
+
+
+# Qaysi handler ishlaganini yozib qo'yuvchi ichki middleware
+async def _handler_name(handler, event, data):
+    probe = _probe.get()
+    if probe is not None:
+        probe.handler = data['handler'].callback.__name__
+    return await handler(event, data)
+
+
+# Sintetik bazani yaratish: kinolar (tasodifiy nomlar) va foydalanuvchilar
+async def populate(db_file: str, movies: int, users: int, rng: random.Random):
+    from database import Database
+    db = Database(db_file)
+    await db.connect()
+    await db.migrate()
+    batch = []
+    for _ in range(movies):
+        title = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(1, 3))).capitalize()
+        batch.append((title, rng.choice(_FORMATS), rng.choice(_LANGUAGES), f"BENCH{rng.getrandbits(48):x}"))
+        if len(batch) == 5000:
+            await db.add_movies_bulk(batch)
+            batch = []
+    if batch:
+        await db.add_movies_bulk(batch)
+    async with db._write() as conn:
+        for start in range(0, users, 5000):
+            await conn.executemany(
+                'INSERT OR IGNORE INTO users (id, username, fullname) VALUES (?, ?, ?)',
+                [(_USER_BASE + i, f"user{i}", f"User {i}") for i in range(start, min(users, start + 5000))]
+            )
+        # videolar stub sessiyada muvaffaqiyatli yuboriladi
+        await conn.execute("UPDATE movies SET media_type = 'video' WHERE media_type IS NULL")
+    await db.close()
+
+
+class Bench:
+    def __init__(self, bot_module, args):
+        self.bot = bot_module
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.update_id = 0
+        self.next_user = _USER_BASE + args.users
+
+    def update(self, user_id: int, text: str):
+        from aiogram.types import Update
+        self.update_id += 1
+        message = {
+            'message_id': self.update_id, 'date': 0, 'text': text,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"U{user_id}", 'username': f"u{user_id}"},
+        }
+        return Update.model_validate({'update_id': self.update_id, 'message': message}, context={'bot': self.bot.bot})
+
+    def random_user(self) -> int:
+        return _USER_BASE + self.rng.randrange(max(1, self.args.users))
+
+    async def codes(self, total_movies: int) -> list:
+        # kodlarni aralashtirib, ommaboplik darajasini Zipf bo'yicha berish
+        ranked = list(range(1, total_movies + 1))
+        self.rng.shuffle(ranked)
+        weights = [1 / (rank ** self.args.zipf) for rank in range(1, total_movies + 1)]
+        picks = self.rng.choices(ranked, weights=weights, k=self.args.requests)
+        return [self.update(self.random_user(), str(code)) for code in picks]
+
+    async def start(self, total_movies: int) -> list:
+        updates, seen = [], []
+        for _ in range(self.args.requests):
+            if seen and self.rng.random() < self.args.start_repeat:
+                user_id = self.rng.choice(seen)
+            else:
+                user_id = self.next_user
+                self.next_user += 1
+                seen.append(user_id)
+            updates.append(self.update(user_id, '/start'))
+        return updates
+
+    async def search(self, total_movies: int) -> list:
+        return [
+            self.update(self.random_user(), '/search ' + ' '.join(
+                self.rng.choice(_WORDS)[:self.rng.randint(2, 6)] for _ in range(self.rng.randint(1, 2))
+            ))
+            for _ in range(self.args.requests)
+        ]
+
+    async def feed(self, updates: list) -> tuple:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        probes = []
+
+        async def one(update):
+            async with semaphore:
+                probe = _Probe()
+                _probe.set(probe)
+                start = time.perf_counter()
+                try:
+                    await self.bot.dp.feed_update(self.bot.bot, update)
+                finally:
+                    probe.latency = time.perf_counter() - start
+                    probes.append(probe)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(update) for update in updates))
+        return probes, time.perf_counter() - start
+
+    async def broadcast(self) -> tuple:
+        probes, wall = await self.feed([self.update(_ADMIN_ID, '/broadcast Bench xabari')])
+        start = time.perf_counter()
+        while self.bot.broadcaster.active:
+            await asyncio.sleep(0.01)
+        wall += time.perf_counter() - start
+        # fon vazifasi shu update kontekstida ishlaydi — butun yuborish bitta so'rov deb hisoblanadi
+        probes[0].latency = wall
+        return probes, wall
+
+
+def report(name: str, probes: list, wall: float, flush: float, api: Counter, extra: str = ''):
+    latencies = [p.latency for p in probes]
+    db_time = sum(p.db_time for p in probes)
+    print(f"\n== {name}: {len(probes)} ta so'rov, {wall:.2f} s, {len(probes) / wall if wall else 0:.0f} req/s, "
+          f"p50 {_quantile(latencies, 0.5) * 1000:.2f} ms, p99 {_quantile(latencies, 0.99) * 1000:.2f} ms, "
+          f"flush {flush * 1000:.1f} ms")
+    print(f"   API: {dict(api.most_common())}")
+    if extra:
+        print(f"   {extra}")
+    by_handler = defaultdict(list)
+    for probe in probes:
+        by_handler[probe.handler].append(probe)
+    print(f"   {'handler':<20} {'count':>7} {'p50 ms':>8} {'p99 ms':>8} {'db ms':>8} {'db calls':>9} {'db %':>6}")
+    for handler, items in sorted(by_handler.items(), key=lambda kv: -len(kv[1])):
+        latencies = [p.latency for p in items]
+        total = sum(latencies)
+        db = sum(p.db_time for p in items)
+        print(
+            f"   {handler:<20} {len(items):>7} {_quantile(latencies, 0.5) * 1000:>8.2f} "
+            f"{_quantile(latencies, 0.99) * 1000:>8.2f} {db / len(items) * 1000:>8.3f} "
+            f"{sum(p.db_calls for p in items) / len(items):>9.2f} {db / total * 100 if total else 0:>5.0f}%"
+        )
+    return db_time
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    if args.rebuild or not os.path.exists(args.db):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        start = time.perf_counter()
+        await populate(args.db, args.movies, args.users, rng)
+        print(f"Baza tayyorlandi: {args.movies} kino, {args.users} foydalanuvchi, {time.perf_counter() - start:.1f} s")
+
+    import bot as bot_module
+    from broadcast import RateLimiter
+    session = make_session(args.api_latency / 1000)
+    bot_module.bot.session = session
+    # yuklama testida cheklovlar o'lchovga xalaqit bermasin
+    throttling = bot_module.throttling
+    throttling.rate = throttling.burst = throttling.admin_rate = throttling.admin_burst = 1e9
+    throttling.debounce = 0
+    bot_module.broadcaster.limiter = RateLimiter(rate=args.broadcast_rate, per_chat_interval=0)
+    for router in (bot_module.router, bot_module.addmovie_router):
+        router.message.middleware(_handler_name)
+        router.callback_query.middleware(_handler_name)
+    instrument_db(bot_module.db)
+
+    await bot_module.on_startup()
+    try:
+        total_movies = (await bot_module.db.get_stats())['movies']
+        bench = Bench(bot_module, args)
+        print(f"Python {sys.version.split()[0]}, parallel: {args.concurrency}, API kechikishi: {args.api_latency} ms")
+        for name in args.scenarios.split(','):
+            session.calls.clear()
+            if name == 'broadcast':
+                probes, wall = await bench.broadcast()
+                sent = session.calls['SendMessage']
+                extra = f"{sent} ta xabar, {sent / wall:.0f} msg/s"
+            else:
+                updates = await getattr(bench, name)(total_movies)
+                probes, wall = await bench.feed(updates)
+                extra = f"kino keshi: {bot_module.db.movie_cache_stats()}" if name == 'codes' else ''
+            start = time.perf_counter()
+            await bot_module.db.flush()
+            report(name, probes, wall, time.perf_counter() - start, Counter(session.calls), extra)
+    finally:
+        await bot_module.on_shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kino-bot oflayn yuklama testi")
+    parser.add_argument('--db', default='bench.db', help="test bazasi fayli")
+    parser.add_argument('--rebuild', action='store_true', help="bazani qaytadan yaratish")
+    parser.add_argument('--movies', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=5000, help="har bir ssenariy uchun so'rovlar")
+    parser.add_argument('--concurrency', type=int, default=50, help="bir vaqtda ishlanadigan update lar")
+    parser.add_argument('--zipf', type=float, default=1.1, help="kodlar ommabopligi (katta — notekisroq)")
+    parser.add_argument('--start-repeat', type=float, default=0.3, help="/start dagi qaytgan foydalanuvchilar ulushi")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="stub API kechikishi, ms")
+    parser.add_argument('--broadcast-rate', type=float, default=1e6, help="ommaviy xabar tezligi, msg/s")
+    parser.add_argument('--scenarios', default='codes,start,search,broadcast')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # bot.py import qilinishidan oldin: test bazasi, xotiradagi FSM, tarmoqsiz token
+    os.environ['DATABASE_FILE'] = args.db
+    os.environ['FSM_STORAGE'] = 'memory'
+    os.environ['BOT_TOKEN'] = '123456:bench'
+    os.environ['MAIN_ADMIN'] = str(_ADMIN_ID)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
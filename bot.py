@@ -1,23 +1,62 @@
-import os
+import sys
+
+
+# --check: sozlamalar va bazani tez tekshirish (aiogram yuklanmaydi) —
+# health probe va rolling restart uchun; 0 — hammasi joyida, 1 — xato bor
+def check() -> int:
+    try:
+        from config import validate, DATABASE_FILE
+        from database import check_database
+    except Exception as e:
+        print(f"❌ Sozlamalar o'qilmadi: {e}")
+        return 1
+    errors = validate()
+    db_errors, notes = check_database(DATABASE_FILE)
+    errors += db_errors
+    for note in notes:
+        print(f"ℹ️ {note}")
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print("✅ OK")
+    return 1 if errors else 0
+
+if __name__ == "__main__" and "--check" in sys.argv[1:]:
+    sys.exit(check())
+
 import asyncio
 import logging
-from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command, Text
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, StateFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram import Router
-from aiogram.fsm.storage.memory import MemoryStorage
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from database import Database
-from utils import human_time
-
-# Env yuklash
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-MAIN_ADMIN = int(os.getenv("MAIN_ADMIN", "0"))
+from config import (
+    BOT_TOKEN, MAIN_ADMIN, validate,
+    VIEWS_FLUSH_INTERVAL, ADS_SYNC_INTERVAL, SEARCH_PAGE_SIZE, LIST_PAGE_SIZE,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS, CACHE_SYNC_INTERVAL, PRIMARY_WORKER,
+    METRICS_ENABLED, METRICS_PATH, METRICS_LOG_INTERVAL, ARCHIVE_TIME, ARCHIVE_INACTIVE_DAYS,
+)
+from subscription import SubscriptionChecker
+from broadcast import Broadcaster
+from ads import AdScheduler, make_trigger
+from delivery import MovieSender, guess_media_type
+from search import clean_query
+from importer import parse_movies
+from middlewares import ThrottlingMiddleware, ActivityMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware
+from metrics import metrics, instrument_database
+from storage import create_storage
 
-if not BOT_TOKEN or MAIN_ADMIN == 0:
-    raise RuntimeError("BOT_TOKEN yoki MAIN_ADMIN .env da to'ldirilmagan!")
+# Sozlamalar faqat config.py orqali (.env bir marta yuklanadi)
+config_errors = validate()
+if config_errors:
+    raise RuntimeError("; ".join(config_errors))
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -25,11 +64,27 @@ logger = logging.getLogger(__name__)
 
 # Bot yaratish
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+storage = create_storage()
 dp = Dispatcher(storage=storage)
 router = Router()
+# kino qo'shish bosqichlari (faqat shu holatdagi admin xabarlari uchun)
+addmovie_router = Router()
 db = Database()
-scheduler = AsyncIOScheduler()
+# Scheduler birinchi vazifa qo'shilganda yaratiladi (import va --check tezroq bo'lishi uchun)
+scheduler = None
+
+def get_scheduler():
+    global scheduler
+    if scheduler is None:
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        scheduler = AsyncIOScheduler()
+    return scheduler
+
+subscription = SubscriptionChecker(bot, db)
+sender = MovieSender(bot, db)
+broadcaster = Broadcaster(bot, db)
+# reklamalar ommaviy xabar bilan bir xil tezlik cheklovchisidan foydalanadi
+ad_scheduler = AdScheduler(bot, db, get_scheduler, broadcaster.limiter)
 
 # --- Helperlar ---
 async def is_admin(user_id: int) -> bool:
@@ -38,24 +93,37 @@ async def is_admin(user_id: int) -> bool:
     admins = await db.get_admins()
     return user_id in admins
 
-async def require_subscription_markup():
-    channels = await db.get_channels()
+async def require_subscription_markup(channels: list = None):
+    if channels is None:
+        channels = await db.get_channels()
     buttons = []
     for ch in channels:
         buttons.append([InlineKeyboardButton(text=f"📢 @{ch}", url=f"https://t.me/{ch}")])
     buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_sub")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+# Faqat haqiqatan yangi foydalanuvchilar haqida (db.flush_users dan keyin)
+async def notify_new_users(users: list):
+    if await db.get_setting('notification_new_user') != 'true':
+        return
+    if len(users) > 5:
+        # kampaniya paytida adminni ko'p xabar bilan to'ldirmaslik uchun
+        text = f"Yangi foydalanuvchilar: {len(users)} ta"
+    else:
+        text = "\n".join(f"Yangi foydalanuvchi: {fullname} (@{username}) — {uid}" for uid, username, fullname in users)
+    try:
+        await bot.send_message(MAIN_ADMIN, text)
+    except Exception:
+        pass
+
+db.on_new_users = notify_new_users
+
 # --- Foydalanuvchi komandalar ---
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     user = message.from_user
+    # navbatga qo'shiladi; yangi foydalanuvchi haqida xabar notify_new_users da
     await db.add_user(user.id, user.username or "", user.full_name or "")
-    if await db.get_setting('notification_new_user'):
-        try:
-            await bot.send_message(MAIN_ADMIN, f"Yangi foydalanuvchi: {user.full_name} (@{user.username}) — {user.id}")
-        except Exception:
-            pass
     await message.answer("Assalomu alaykum! Kino-kod yuboring yoki /help bilan yordam oling.")
 
 @router.message(Command("help"))
@@ -68,58 +136,95 @@ async def cmd_help(message: Message):
     )
     await message.answer(txt)
 
+class SearchPage(CallbackData, prefix="srch"):
+    page: int
+    q: str
+
+# callback_data 64 baytdan oshmasligi uchun so'rovni qisqartirish
+def _short_query(q: str, limit: int = 48) -> str:
+    return q.encode()[:limit].decode(errors="ignore").strip()
+
+async def render_search(q: str, page: int):
+    results = await db.search_movies(q, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    if not results:
+        return None, None
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    lines = [f"🔎 «{q}» — {page + 1}-sahifa\n"]
+    for m in results[:SEARCH_PAGE_SIZE]:
+        lines.append(f"🆔 {m.code} — 🎬 {m.title} ({m.format} | {m.language}) 👁 {m.views}")
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=SearchPage(page=page - 1, q=q).pack()))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=SearchPage(page=page + 1, q=q).pack()))
+    markup = InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+    return "\n".join(lines), markup
+
 @router.message(Command("search"))
 async def cmd_search(message: Message):
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
         await message.reply("Qidiruv uchun so‘z kiriting: /search Inception")
         return
-    q = args[1].strip()
-    results = await db.search_movies(q)
-    if not results:
+    q = _short_query(clean_query(args[1]))
+    text, markup = await render_search(q, 0) if q else (None, None)
+    if not text:
         await message.reply("Hech narsa topilmadi.")
         return
-    for movie in results:
-        code, title, fmt, lang, file_id, views, is_deleted = movie
-        await message.reply(f"🎬 {title}\n🆔 {code}\n📀 {fmt}  |  {lang}\n👁 {views}")
+    await message.reply(text, reply_markup=markup)
+
+@router.callback_query(SearchPage.filter())
+async def cb_search_page(callback: CallbackQuery, callback_data: SearchPage):
+    text, markup = await render_search(callback_data.q, max(0, callback_data.page))
+    if not text:
+        await callback.answer("Boshqa natija yo'q.")
+        return
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
 
 @router.message(lambda m: m.text and m.text.isdigit())
 async def handle_code(message: Message):
     user_id = message.from_user.id
     # Majburiy obuna tekshiruvi
-    if await db.get_setting('force_subscribe') == 'true':
-        channels = await db.get_channels()
-        if channels:
-            try:
-                ok = True
-                for ch in channels:
-                    member = await bot.get_chat_member(f"@{ch}", user_id)
-                    if member.status in ['left', 'kicked']:
-                        ok = False
-                        break
-                if not ok:
-                    markup = await require_subscription_markup()
-                    await message.answer("Botdan foydalanish uchun kanal(lar)ga obuna bo'ling:", reply_markup=markup)
-                    return
-            except Exception:
-                # agar kanalni tekshirishda xato bo'lsa, davom etish uchun pass
-                pass
+    missing = await subscription.missing_channels(user_id)
+    if missing:
+        markup = await require_subscription_markup(missing)
+        await message.answer("Botdan foydalanish uchun kanal(lar)ga obuna bo'ling:", reply_markup=markup)
+        return
 
     code = int(message.text)
     movie = await db.get_movie(code)
     if not movie:
         await message.reply("⚠️ Bunday kodli kino topilmadi.")
         return
-    code, title, fmt, lang, file_id, views, is_deleted = movie
-    caption = f"🎬 {title}\n🆔 {code}\n📀 {fmt}\n🗣 {lang}\n👁 {views}"
+    caption = f"🎬 {movie.title}\n🆔 {movie.code}\n📀 {movie.format}\n🗣 {movie.language}\n👁 {movie.views}"
     try:
-        # agar video bo'lsa yuborish, aks holda fayl_id sifatida yuborish
-        await bot.send_video(chat_id=user_id, video=file_id, caption=caption)
+        # saqlangan turi bo'yicha (video/document/animation/kanaldan nusxa) yuborish
+        sent = await sender.send(user_id, movie, caption)
     except Exception:
+        sent = False
+    if not sent:
         # fallback: oddiy xabar bilan link/ma'lumot
         await message.answer(caption + "\n(Fayl yuborilmadi — file_id yoki link noto'g'ri)")
     await db.increment_views(code)
 
+@router.callback_query(F.data == "check_sub")
+async def cb_check_sub(callback: CallbackQuery):
+    missing = await subscription.missing_channels(callback.from_user.id, fresh=True)
+    if missing:
+        await callback.answer("❌ Hali barcha kanallarga obuna bo'lmagansiz.", show_alert=True)
+        markup = await require_subscription_markup(missing)
+        try:
+            await callback.message.edit_reply_markup(reply_markup=markup)
+        except Exception:
+            pass
+        return
+    await callback.answer("✅ Obuna tasdiqlandi!")
+    try:
+        await callback.message.edit_text("✅ Obuna tasdiqlandi. Endi kino kodini yuboring.")
+    except Exception:
+        pass
+
 # --- Admin komandalar ---
 @router.message(Command("admin"))
 async def cmd_admin(message: Message):
@@ -134,38 +239,141 @@ async def cmd_admin(message: Message):
         "/addmovie — kino qo'shish\n"
         "/delmovie <code> — kino o'chirish\n"
         "/listmovies — kinolar ro'yxati\n"
+        "/broken — fayli yaroqsiz kinolar\n"
+        "/setfile <code> — kino faylini almashtirish (videoga javob sifatida)\n"
         "/broadcast — hamma foydalanuvchilarga xabar yuborish\n"
         "/setchannel <username> — kanal qo'shish (majburiy obuna)\n"
         "/rmchannel <username> — kanalni o'chirish\n"
         "/addadmin <user_id> — admin qo'shish\n"
         "/rmadmin <user_id> — admin o'chirish\n"
         "/set <key> <value> — sozlamani o'zgartirish\n"
+        "/metrics — ishlash ko'rsatkichlari\n"
     )
     await message.answer(txt)
 
+class AddMovie(StatesGroup):
+    video = State()
+    title = State()
+    format = State()
+    language = State()
+
 @router.message(Command("addmovie"))
-async def cmd_addmovie(message: Message):
+async def cmd_addmovie(message: Message, state: FSMContext):
     if not await is_admin(message.from_user.id):
         await message.reply("🚫 Siz admin emassiz.")
         return
-    # simple flow: admin yuboradi -> keyingi xabarda nom; implement minimal interactive flow
-    await message.answer("📥 Kino qo'shish: Quyidagi formatda yuboring:\nTitle | format | language | file_id\nMasalan:\nInception | mp4 | English | file_123")
+    await state.set_state(AddMovie.video)
+    await message.answer(
+        "📥 Kino qo'shish: videoni yuboring yoki kanaldan forward qiling.\n"
+        "Izohda \"Title | format | language\" bo'lsa, kino darhol qo'shiladi, aks holda so'rab olinadi.\n"
+        "Bekor qilish: /cancel\n\n"
+        "Ko'p kinoni birdaniga qo'shish: CSV/JSON faylni /import izohi bilan yuboring."
+    )
 
-@router.message()
-async def admin_addmovie_flow(message: Message):
-    # Agar admin va format mos bo'lsa, qo'shamiz
+@router.message(F.document, F.caption.startswith("/import"))
+async def cmd_import(message: Message, state: FSMContext):
     if not await is_admin(message.from_user.id):
+        await message.reply("🚫 Siz admin emassiz.")
         return
-    text = message.text
-    if "|" not in text:
+    # /addmovie dan keyin yuborilgan bo'lsa, kino qo'shish bosqichi tugaydi
+    await state.clear()
+    data = await bot.download(message.document)
+    try:
+        movies = parse_movies(data.read(), message.document.file_name or "")
+    except ValueError as e:
+        await message.reply(f"⚠️ Fayl o'qilmadi: {e}")
         return
-    parts = [p.strip() for p in text.split("|")]
-    if len(parts) != 4:
+    if not movies:
+        await message.reply("Faylda kino topilmadi.")
         return
-    title, fmt, lang, file_id = parts
-    code = await db.add_movie(title, fmt, lang, file_id)
+    first, last = await db.add_movies_bulk(movies)
+    await message.reply(f"✅ {len(movies)} ta kino qo'shildi. Kodlar: {first}–{last}")
+
+# Xabardagi fayl: (file_id, taxminiy format, yuborish turi)
+def _media_of(message: Message):
+    for media_type in ("video", "document", "animation"):
+        media = getattr(message, media_type)
+        if media is not None:
+            break
+    else:
+        # kanaldan forward qilingan boshqa xabar — saqlash kanalidan nusxa olinadi
+        origin = message.forward_origin
+        if origin is not None and origin.type == "channel":
+            return f"{origin.chat.id}:{origin.message_id}", None, "copy"
+        return None, None, None
+    name = getattr(media, "file_name", None) or ""
+    if "." in name:
+        fmt = name.rsplit(".", 1)[1].lower()
+    else:
+        fmt = (media.mime_type or "").split("/")[-1] or None
+    return media.file_id, fmt, media_type
+
+async def _save_movie(message: Message, state: FSMContext, title: str, fmt: str, lang: str, file_id: str,
+                      media_type: str = None):
+    code = await db.add_movie(title, fmt, lang, file_id, media_type or guess_media_type(file_id))
+    await state.clear()
     await message.reply(f"✅ Kino qo'shildi. Kod: {code}")
 
+@addmovie_router.message(StateFilter(AddMovie), Command("cancel"))
+async def addmovie_cancel(message: Message, state: FSMContext):
+    await state.clear()
+    await message.reply("❌ Kino qo'shish bekor qilindi.")
+
+# "/import" izohli fayl cmd_import ga o'tadi
+@addmovie_router.message(
+    AddMovie.video,
+    F.video | F.document | F.animation | (F.forward_origin.type == "channel"),
+    ~F.caption.startswith("/import"),
+)
+async def addmovie_video(message: Message, state: FSMContext):
+    file_id, fmt, media_type = _media_of(message)
+    caption = (message.caption or "").strip()
+    parts = [p.strip() for p in caption.split("|")] if "|" in caption else []
+    if len(parts) == 3 and all(parts):
+        await _save_movie(message, state, parts[0], parts[1], parts[2], file_id, media_type)
+        return
+    await state.update_data(file_id=file_id, format=fmt, media_type=media_type)
+    if caption and not parts:
+        # izoh — kino nomi deb olinadi
+        await state.update_data(title=caption.splitlines()[0])
+        await state.set_state(AddMovie.format)
+        await message.reply(f"📀 Formatni yuboring (masalan: mp4). Standart: {fmt or '-'} — '-' yuborsangiz shu olinadi.")
+        return
+    await state.set_state(AddMovie.title)
+    await message.reply("🎬 Kino nomini yuboring:")
+
+# Eski usul: "Title | format | language | file_id" matni
+@addmovie_router.message(AddMovie.video, F.text, ~F.text.startswith("/"))
+async def addmovie_text(message: Message, state: FSMContext):
+    parts = [p.strip() for p in message.text.split("|")]
+    if len(parts) != 4 or not all(parts):
+        await message.reply("Videoni yuboring yoki \"Title | format | language | file_id\" formatida yozing. Bekor qilish: /cancel")
+        return
+    await _save_movie(message, state, *parts)
+
+@addmovie_router.message(AddMovie.title, F.text, ~F.text.startswith("/"))
+async def addmovie_title(message: Message, state: FSMContext):
+    await state.update_data(title=message.text.strip())
+    await state.set_state(AddMovie.format)
+    fmt = (await state.get_data()).get("format")
+    await message.reply(f"📀 Formatni yuboring (masalan: mp4). Standart: {fmt or '-'} — '-' yuborsangiz shu olinadi.")
+
+@addmovie_router.message(AddMovie.format, F.text, ~F.text.startswith("/"))
+async def addmovie_format(message: Message, state: FSMContext):
+    fmt = message.text.strip()
+    if fmt != "-":
+        await state.update_data(format=fmt)
+    await state.set_state(AddMovie.language)
+    await message.reply("🗣 Tilini yuboring (masalan: O'zbek):")
+
+@addmovie_router.message(AddMovie.language, F.text, ~F.text.startswith("/"))
+async def addmovie_language(message: Message, state: FSMContext):
+    data = await state.get_data()
+    await _save_movie(
+        message, state, data["title"], data.get("format") or "", message.text.strip(),
+        data["file_id"], data.get("media_type"),
+    )
+
 @router.message(Command("delmovie"))
 async def cmd_delmovie(message: Message):
     if not await is_admin(message.from_user.id):
@@ -182,19 +390,112 @@ async def cmd_delmovie(message: Message):
     except Exception:
         await message.reply("Kod noto'g'ri yoki xato yuz berdi.")
 
+# Fayli yaroqsiz deb belgilangan kinolar hisoboti
+@router.message(Command("broken"))
+async def cmd_broken(message: Message):
+    if not await is_admin(message.from_user.id):
+        await message.reply("🚫 Siz admin emassiz.")
+        return
+    movies = await db.get_broken_movies(limit=30)
+    if not movies:
+        await message.reply("✅ Yaroqsiz fayllar yo'q.")
+        return
+    total = await db.count_broken_movies()
+    text = f"⚠️ Fayli yaroqsiz kinolar ({total} ta):\n\n"
+    text += "\n".join(f"{m.code} — {m.title}: {m.broken}" for m in movies)
+    text += "\n\nTuzatish: yangi videoga /setfile <code> deb javob yozing."
+    await message.reply(text)
+
+# Kino faylini almashtirish: videoga javob sifatida "/setfile <code>" yoki "/setfile <code> <file_id|havola>"
+@router.message(Command("setfile"))
+async def cmd_setfile(message: Message):
+    if not await is_admin(message.from_user.id):
+        await message.reply("🚫 Siz admin emassiz.")
+        return
+    args = message.text.split()
+    if len(args) < 2 or not args[1].isdigit():
+        await message.reply("Foydalanish: videoga javob sifatida /setfile <code> yoki /setfile <code> <file_id>")
+        return
+    if len(args) > 2:
+        file_id, media_type = args[2], guess_media_type(args[2])
+    elif message.reply_to_message is not None:
+        file_id, _, media_type = _media_of(message.reply_to_message)
+    else:
+        file_id = None
+    if not file_id:
+        await message.reply("Fayl topilmadi: video/hujjatga javob yozing yoki file_id kiriting.")
+        return
+    if await db.set_movie_file(int(args[1]), file_id, media_type):
+        await message.reply("✅ Kino fayli yangilandi.")
+    else:
+        await message.reply("⚠️ Bunday kodli kino topilmadi.")
+
+class MoviesPage(CallbackData, prefix="mv"):
+    sort: str
+    code: int = 0
+    views: int = 0
+    back: bool = False
+    first: bool = False
+
+SORT_TITLES = {'code': "🔢 Kod", 'new': "🆕 Yangi", 'top': "🔥 Top"}
+
+async def render_movies_page(sort: str, cursor=None, back: bool = False):
+    rows = await db.get_movies_page(sort, cursor, limit=LIST_PAGE_SIZE + 1, backward=back)
+    if back:
+        has_prev, has_next = len(rows) > LIST_PAGE_SIZE, True
+        rows = rows[-LIST_PAGE_SIZE:]
+    else:
+        has_prev, has_next = cursor is not None, len(rows) > LIST_PAGE_SIZE
+        rows = rows[:LIST_PAGE_SIZE]
+    if not rows:
+        return None, None
+    text = f"🎬 Kinolar ro'yxati ({SORT_TITLES[sort]}):\n\n"
+    text += "\n".join(f"{m.code} — {m.title} ({m.format} | {m.language}) views:{m.views}" for m in rows)
+
+    # keyset kursori bazadagi qiymat bo'yicha (hali yozilmagan ko'rishlarsiz)
+    def page(m, back):
+        return MoviesPage(sort=sort, code=m.code, views=m.views - db.pending_views(m.code), back=back).pack()
+
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=page(rows[0], True)))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=page(rows[-1], False)))
+    sorts = [
+        InlineKeyboardButton(text=title, callback_data=MoviesPage(sort=key, first=True).pack())
+        for key, title in SORT_TITLES.items() if key != sort
+    ]
+    markup = InlineKeyboardMarkup(inline_keyboard=[row for row in (nav, sorts) if row])
+    return text, markup
+
 @router.message(Command("listmovies"))
 async def cmd_listmovies(message: Message):
     if not await is_admin(message.from_user.id):
         await message.reply("🚫 Siz admin emassiz.")
         return
-    movies = await db.get_all_movies()
-    if not movies:
+    text, markup = await render_movies_page('code')
+    if not text:
         await message.reply("Kinolar topilmadi.")
         return
-    text = "🎬 Kinolar ro'yxati:\n\n"
-    for m in movies:
-        text += f"{m[0]} — {m[1]} ({m[2]} | {m[3]}) views:{m[5]}\n"
-    await message.reply(text)
+    await message.reply(text, reply_markup=markup)
+
+@router.callback_query(MoviesPage.filter())
+async def cb_movies_page(callback: CallbackQuery, callback_data: MoviesPage):
+    if not await is_admin(callback.from_user.id) or callback_data.sort not in SORT_TITLES:
+        await callback.answer()
+        return
+    if callback_data.first:
+        cursor = None
+    elif callback_data.sort == 'top':
+        cursor = (callback_data.views, callback_data.code)
+    else:
+        cursor = callback_data.code
+    text, markup = await render_movies_page(callback_data.sort, cursor, callback_data.back)
+    if not text:
+        await callback.answer("Boshqa kino yo'q.")
+        return
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
 
 @router.message(Command("broadcast"))
 async def cmd_broadcast(message: Message):
@@ -205,17 +506,8 @@ async def cmd_broadcast(message: Message):
     if len(args) < 2:
         await message.reply("Foydalanish: /broadcast <xabar>")
         return
-    text = args[1]
-    users = await db.get_all_users()
-    sent = 0
-    for uid in users:
-        try:
-            await bot.send_message(uid, text)
-            sent += 1
-            await asyncio.sleep(0.05)  # rate limit uchun kichik tanaffus
-        except Exception:
-            continue
-    await message.reply(f"✅ Xabar yuborildi: {sent}/{len(users)} ga")
+    # fon vazifasi sifatida yuboriladi, jarayon bitta xabarda yangilanib boradi
+    await broadcaster.start(args[1], message.chat.id)
 
 @router.message(Command("setchannel"))
 async def cmd_setchannel(message: Message):
@@ -281,41 +573,171 @@ async def cmd_stats(message: Message):
         await message.reply("🚫 Siz admin emassiz.")
         return
     s = await db.get_stats()
-    await message.reply(f"👥 {s['users']}  🎬 {s['movies']}  👁 {s['total_views']}")
+    lines = [f"👥 {s['users']}  🎬 {s['movies']}  👁 {s['total_views']}", "", "📅 Kun | ➕ yangi | 🙋 faol | 👁 ko'rish"]
+    for day, new_users, active_users, views in await db.get_daily_stats(7):
+        lines.append(f"{day} | {new_users} | {active_users} | {views}")
+    top = await db.get_top_movies_for_day(limit=5)
+    if top:
+        lines += ["", "🔥 Bugun eng ko'p ko'rilgan:"]
+        for code, views in top:
+            movie = await db.get_movie(code)
+            title = movie.title if movie else "(o'chirilgan)"
+            lines.append(f"{code} — {title}: {views}")
+    await message.reply("\n".join(lines))
+
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    if not await is_admin(message.from_user.id):
+        await message.reply("🚫 Siz admin emassiz.")
+        return
+    if not METRICS_ENABLED:
+        await message.reply("Metrikalar o'chirilgan (METRICS_ENABLED=false).")
+        return
+    await message.reply(metrics.summary())
 
-# include router
+# include router (kino qo'shish bosqichlari umumiy handlerlardan oldin tekshiriladi)
+dp.include_router(addmovie_router)
 dp.include_router(router)
 
-# Scheduler misol uchun reklamalarni yuborish (oddiy)
-async def send_scheduled_ads():
-    ads = await db.get_scheduled_ads()
-    users = await db.get_all_users()
-    for ad in ads:
-        ad_id, image_file_id, text, btn_text, btn_url, schedule_time, repeat_count = ad
-        for uid in users:
-            try:
-                if image_file_id:
-                    await bot.send_photo(uid, image_file_id, caption=text)
-                else:
-                    await bot.send_message(uid, text)
-            except Exception:
-                continue
-        # repeat_count kamaytirish
-        if repeat_count and repeat_count > 0:
-            await db.update_ad_count(ad_id, repeat_count - 1)
+# har bir foydalanuvchi uchun so'rovlar tezligini cheklash (filtrlardan oldin ishlaydi)
+throttling = ThrottlingMiddleware(is_admin)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+# kunlik faol foydalanuvchilar statistikasi
+activity = ActivityMiddleware(db)
+dp.message.outer_middleware(activity)
+dp.callback_query.outer_middleware(activity)
 
-async def main():
-    await db.create_tables()
-    # super adminni jadvalga qo'shish
-    await db.add_admin(MAIN_ADMIN)
-    # scheduler ishga tushirish (har 1 soatda misol)
-    scheduler.add_job(send_scheduled_ads, 'interval', hours=1)
-    scheduler.start()
-    logger.info("Bot ishga tushmoqda...")
+# handlerlar, baza va Telegram API vaqtlari (/metrics, METRICS_PATH)
+if METRICS_ENABLED:
+    instrument_database(db)
+    handler_metrics = HandlerMetricsMiddleware()
+    for r in (addmovie_router, router):
+        r.message.middleware(handler_metrics)
+        r.callback_query.middleware(handler_metrics)
+    bot.session.middleware(ApiMetricsMiddleware())
+    metrics.gauge('broadcast_pending', "Ommaviy xabar navbatidagi foydalanuvchilar", lambda: broadcaster.pending)
+    metrics.gauge('throttled_updates', "Tezlik cheklovi tashlab yuborgan update lar", lambda: throttling.dropped)
+    metrics.gauge('movie_cache_hits', "Kino keshidan topilganlar", lambda: db.movie_cache_stats()['hits'])
+    metrics.gauge('movie_cache_misses', "Kino keshida topilmaganlar", lambda: db.movie_cache_stats()['misses'])
+
+def log_metrics():
+    logger.info("Metrikalar:\n%s", metrics.summary())
+
+# Kunlik texnik xizmat (kam trafikli vaqtda): arxivlash va bazani siqish
+async def run_maintenance():
+    if broadcaster.active:
+        logger.info("Ommaviy xabar yuborilmoqda — texnik xizmat ertaga qoldirildi")
+        return
+    # navbatdagi faollik yozilsin, aks holda faol foydalanuvchi eskirgan deb arxivlanishi mumkin
+    await db.flush()
+    movies = await db.archive_movies()
+    users = await db.archive_users(ARCHIVE_INACTIVE_DAYS)
+    result = await db.optimize()
+    logger.info("Texnik xizmat: %s kino va %s foydalanuvchi arxivlandi, %s", movies, users, result)
+
+async def on_startup():
+    await db.connect()
+    # sxema faqat versiya eskirgan bo'lsa yangilanadi
+    await db.migrate()
+    # birinchi so'rovlar bazaga bormasligi uchun
+    await db.warm_cache()
+    # super adminni jadvalga qo'shish (faqat birinchi marta)
+    if MAIN_ADMIN not in await db.get_admins():
+        await db.add_admin(MAIN_ADMIN)
+    jobs = get_scheduler()
+    if PRIMARY_WORKER:
+        # har bir reklama o'z vaqtida; yangi/o'chirilgan reklamalar vaqti-vaqti bilan moslashtiriladi
+        await ad_scheduler.sync()
+        jobs.add_job(ad_scheduler.sync, 'interval', minutes=ADS_SYNC_INTERVAL,
+                     id='ads_sync', max_instances=1, coalesce=True)
+        if ARCHIVE_TIME:
+            jobs.add_job(run_maintenance, make_trigger(ARCHIVE_TIME), id='maintenance',
+                         max_instances=1, coalesce=True, misfire_grace_time=3600)
+    if CACHE_SYNC_INTERVAL > 0:
+        # boshqa jarayonlardagi o'zgarishlar (sozlamalar, kanallar, adminlar, kinolar)
+        jobs.add_job(db.sync_cache, 'interval', seconds=CACHE_SYNC_INTERVAL,
+                     id='cache_sync', max_instances=1, coalesce=True)
+        if PRIMARY_WORKER:
+            jobs.add_job(db.prune_cache_events, 'interval', minutes=10,
+                         id='cache_prune', max_instances=1, coalesce=True)
+    if METRICS_ENABLED and METRICS_LOG_INTERVAL > 0:
+        jobs.add_job(log_metrics, 'interval', minutes=METRICS_LOG_INTERVAL,
+                     id='metrics_log', max_instances=1, coalesce=True)
+    # ko'rishlar va faollik hisoblagichlarini vaqti-vaqti bilan bazaga yozish
+    jobs.add_job(db.flush, 'interval', seconds=VIEWS_FLUSH_INTERVAL,
+                 id='flush', max_instances=1, coalesce=True)
+    jobs.start()
+    if PRIMARY_WORKER:
+        # to'xtab qolgan ommaviy xabarlarni davom ettirish
+        await broadcaster.resume_all()
+
+async def on_shutdown():
+    await broadcaster.stop()
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+    # db.close() yozilmagan ko'rishlarni ham saqlaydi
+    await db.close()
+    await dp.storage.close()
+
+async def set_webhook():
+    if not WEBHOOK_URL:
+        logger.warning("WEBHOOK_URL bo'sh — set_webhook chaqirilmadi (lokal rejim)")
+        return
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+async def run_polling():
+    # webhook o'rnatilgan bo'lsa getUpdates ishlamaydi
+    await bot.delete_webhook()
     try:
         await dp.start_polling(bot)
     finally:
         await bot.session.close()
 
+# aiohttp ilovasi: startup/shutdown dispatcher hooklari orqali (polling bilan bir xil),
+# yangilanishlar fon vazifalarida parallel qayta ishlanadi
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+def create_webhook_app() -> web.Application:
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot,
+        secret_token=WEBHOOK_SECRET or None,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    if METRICS_ENABLED and METRICS_PATH:
+        # Prometheus scrape uchun; tashqi kirishni reverse proxy da cheklang
+        app.router.add_get(METRICS_PATH, metrics_handler)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook():
+    dp.startup.register(set_webhook)
+    runner = web.AppRunner(create_webhook_app())
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Webhook %s:%s%s da tinglanmoqda", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # on_shutdown hooklari va bot sessiyasini yopish shu yerda bajariladi
+        await runner.cleanup()
+
+async def main():
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    logger.info("Bot ishga tushmoqda (%s)...", BOT_MODE)
+    if BOT_MODE == "webhook":
+        await run_webhook()
+    else:
+        await run_polling()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
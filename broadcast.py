@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest,
+    TelegramNetworkError, TelegramServerError,
+)
+from config import (
+    BROADCAST_RATE, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_CONCURRENCY,
+    BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_INTERVAL, BROADCAST_MAX_RETRIES,
+    BROADCAST_MAX_FLOOD_WAITS,
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Yetkazish natijalari
+SENT = 'sent'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+# Foydalanuvchi endi mavjud emasligini bildiruvchi BadRequest matnlari
+_DEAD_CHAT_ERRORS = ('chat not found', 'user is deactivated', 'peer_id_invalid')
+
+
+# Token bucket: umumiy tezlik + har bir chat uchun minimal oraliq
+class RateLimiter:
+    def __init__(self, rate: float = BROADCAST_RATE, burst: float = None,
+                 per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.per_chat_interval = per_chat_interval
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_next = {}
+        self._lock = asyncio.Lock()
+
+    # Telegram retry_after qaytarganda hamma yuborishlarni to'xtatib turish
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id: int = None):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+            if chat_id is None:
+                return
+            send_at = max(now, self._chat_next.get(chat_id, now))
+            self._chat_next[chat_id] = send_at + self.per_chat_interval
+            wait = send_at - now
+            if len(self._chat_next) > 10000:
+                self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# Bitta chatga xabar yuborish: retry_after va vaqtinchalik xatolarni hisobga oladi.
+# retries — tarmoq/server xatolari uchun, flood_waits — retry_after kutishlari uchun alohida limit.
+async def deliver(limiter: RateLimiter, chat_id: int, send, retries: int = BROADCAST_MAX_RETRIES,
+                  flood_waits: int = BROADCAST_MAX_FLOOD_WAITS) -> str:
+    attempt = 0
+    waits = 0
+    while True:
+        await limiter.acquire(chat_id)
+        try:
+            await send(chat_id)
+            return SENT
+        except TelegramRetryAfter as e:
+            logger.warning("Flood limit: %s soniya kutamiz", e.retry_after)
+            metrics.inc('api_retries_total', 'retry_after')
+            limiter.pause(e.retry_after)
+            waits += 1
+            if waits > flood_waits:
+                return FAILED
+            continue
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if any(err in e.message.lower() for err in _DEAD_CHAT_ERRORS):
+                return BLOCKED
+            return FAILED
+        except (TelegramNetworkError, TelegramServerError):
+            metrics.inc('api_retries_total', 'network')
+            await asyncio.sleep(2 ** attempt)
+        except Exception as e:
+            logger.warning("Xabar %s ga yuborilmadi: %s", chat_id, e)
+            return FAILED
+        attempt += 1
+        if attempt > retries:
+            return FAILED
+
+
+# Barcha faol foydalanuvchilarga bo'laklab, cheklangan parallellikda yuborish.
+# send(chat_id) — bitta foydalanuvchiga yuboruvchi korutina.
+# on_batch(last_user_id, counts) — har bir bo'lakdan keyin chaqiriladi.
+async def fan_out(db, limiter: RateLimiter, send, after_id: int = 0, counts: dict = None,
+                  on_batch=None, concurrency: int = BROADCAST_CONCURRENCY,
+                  batch_size: int = BROADCAST_BATCH_SIZE) -> dict:
+    counts = counts if counts is not None else {SENT: 0, FAILED: 0, BLOCKED: 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(uid):
+        async with semaphore:
+            return await deliver(limiter, uid, send)
+
+    while True:
+        user_ids = await db.get_user_ids_after(after_id, batch_size)
+        if not user_ids:
+            break
+        results = await asyncio.gather(*(worker(uid) for uid in user_ids))
+        blocked = []
+        for uid, result in zip(user_ids, results):
+            counts[result] += 1
+            if result == BLOCKED:
+                blocked.append(uid)
+        await db.mark_users_blocked(blocked)
+        after_id = user_ids[-1]
+        if on_batch is not None:
+            await on_batch(after_id, counts)
+    return counts
+
+
+# Ommaviy xabar: fon vazifasi, jarayon bazada saqlanadi va admin xabari yangilanadi
+class Broadcaster:
+    def __init__(self, bot, db, limiter: RateLimiter = None):
+        self.bot = bot
+        self.db = db
+        self.limiter = limiter or RateLimiter()
+        self._tasks = {}
+        # broadcast_id -> (yuborilgan, jami) — ishlayotgan xabarlar qanchalik ortda ekanini ko'rish uchun
+        self._progress = {}
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    # Ishlayotgan ommaviy xabarlarda hali navbatda turgan foydalanuvchilar
+    @property
+    def pending(self) -> int:
+        return sum(max(0, total - processed) for processed, total in self._progress.values())
+
+    # Yangi ommaviy xabarni boshlash (darhol qaytadi)
+    async def start(self, text: str, admin_chat_id: int) -> int:
+        total = await self.db.count_active_users()
+        broadcast_id = await self.db.create_broadcast(text, admin_chat_id, total)
+        msg = await self.bot.send_message(admin_chat_id, f"📤 Xabar #{broadcast_id} yuborilmoqda: 0/{total}")
+        await self.db.set_broadcast_message(broadcast_id, msg.message_id)
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    # Bot qayta ishga tushganda tugallanmaganlarni davom ettirish
+    async def resume_all(self):
+        for broadcast_id in await self.db.get_unfinished_broadcasts():
+            logger.info("Ommaviy xabar #%s davom ettirilmoqda", broadcast_id)
+            self._spawn(broadcast_id)
+
+    # To'xtatish: jarayon bazada saqlangan, keyingi ishga tushishda davom etadi
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, broadcast_id: int):
+        if broadcast_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: (self._tasks.pop(broadcast_id, None), self._progress.pop(broadcast_id, None)))
+
+    async def _report(self, row, counts: dict, done: bool = False):
+        broadcast_id, _, admin_chat_id, message_id = row[:4]
+        total = row[6]
+        processed = counts[SENT] + counts[FAILED] + counts[BLOCKED]
+        head = "✅ Xabar yuborildi" if done else "📤 Xabar yuborilmoqda"
+        text = (
+            f"{head} #{broadcast_id}: {processed}/{total}\n"
+            f"✔️ Yetkazildi: {counts[SENT]}\n"
+            f"🚫 Bloklagan: {counts[BLOCKED]}\n"
+            f"⚠️ Xato: {counts[FAILED]}"
+        )
+        try:
+            if message_id:
+                await self.bot.edit_message_text(text, chat_id=admin_chat_id, message_id=message_id)
+            else:
+                await self.bot.send_message(admin_chat_id, text)
+        except Exception as e:
+            logger.debug("Jarayon xabari yangilanmadi: %s", e)
+
+    async def _run(self, broadcast_id: int):
+        row = await self.db.get_broadcast(broadcast_id)
+        if row is None:
+            return
+        _, text, _, _, _, last_user_id, _, sent, failed, blocked = row
+        counts = {SENT: sent, FAILED: failed, BLOCKED: blocked}
+        last_report = 0.0
+
+        async def send(chat_id):
+            await self.bot.send_message(chat_id, text)
+
+        async def on_batch(after_id, counts):
+            nonlocal last_report
+            self._progress[broadcast_id] = (counts[SENT] + counts[FAILED] + counts[BLOCKED], row[6])
+            await self.db.update_broadcast_progress(
+                broadcast_id, after_id, counts[SENT], counts[FAILED], counts[BLOCKED]
+            )
+            if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await self._report(row, counts)
+
+        try:
+            await fan_out(self.db, self.limiter, send, last_user_id, counts, on_batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ommaviy xabar #%s xato bilan to'xtadi", broadcast_id)
+            await self.db.finish_broadcast(broadcast_id, 'failed')
+            await self._report(row, counts, done=True)
+            return
+        await self.db.finish_broadcast(broadcast_id)
+        await self._report(row, counts, done=True)
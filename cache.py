@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+
+# Keshda yo'q qiymatni None dan ajratish uchun belgi
+MISSING = object()
+
+
+# Oddiy TTL kesh: qiymatlar belgilangan vaqtdan keyin eskiradi
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        # Har bir invalidate'da oshadi — eski o'qish natijasi keshga tushib qolmasligi uchun
+        self.generation = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return MISSING
+        return value
+
+    # generation berilsa va o'qish davomida invalidate bo'lgan bo'lsa, yozilmaydi
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        if generation is not None and generation != self.generation:
+            return
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._evict()
+
+    # Eng eski yozuvni O(1) da o'chirish (dict qo'shilish tartibini saqlaydi);
+    # eskirganlar get() da o'chiriladi, butun keshni ko'rib chiqish yo'q
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            del self._data[next(iter(self._data))]
+
+    def invalidate(self, key=None):
+        self.generation += 1
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# LRU kesh: eng uzoq ishlatilmagan yozuv chiqarib yuboriladi, hit/miss hisoblanadi
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # Hisoblagich va tartibga ta'sir qilmasdan o'qish
+    def peek(self, key):
+        return self._data.get(key, MISSING)
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    # Kalitlar nusxasi (hisoblagich va tartibga ta'sir qilmaydi)
+    def keys(self) -> list:
+        return list(self._data)
+
+    def pop(self, key):
+        return self._data.pop(key, MISSING)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
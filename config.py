@@ -1,5 +1,7 @@
 from dotenv import load_dotenv
+import importlib.util
 import os
+import re
 
 # .env faylidan o'zgaruvchilarni yuklash
 load_dotenv()
@@ -8,13 +10,129 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 # Asosiy admin ID
-MAIN_ADMIN = int(os.getenv('MAIN_ADMIN', 6887251996))
+MAIN_ADMIN = int(os.getenv('MAIN_ADMIN', 0))
 
 # Ma'lumotlar bazasi fayli
-DATABASE_FILE = "movies.db"
+DATABASE_FILE = os.getenv('DATABASE_FILE', 'movies.db')
+
+# SQLite ulanishlar hovuzi: bitta yozuvchi + bir nechta o'quvchi (WAL rejimi)
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 4))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+# Manfiy qiymat — KiB hisobida (SQLite qoidasi), standart ~16 MB
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -16000))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+
+# Ko'rishlar hisoblagichi: xotirada yig'ib, bitta tranzaksiyada yozish
+VIEWS_FLUSH_INTERVAL = int(os.getenv('VIEWS_FLUSH_INTERVAL', 30))  # soniya
+VIEWS_FLUSH_THRESHOLD = int(os.getenv('VIEWS_FLUSH_THRESHOLD', 500))
+# /start dagi foydalanuvchilar ham navbatda yig'ilib, shu oraliqda bitta tranzaksiyada yoziladi
+USERS_FLUSH_THRESHOLD = int(os.getenv('USERS_FLUSH_THRESHOLD', 200))
+
+# Sozlamalar, kanallar va adminlar keshining amal qilish muddati (soniya)
+SETTINGS_CACHE_TTL = int(os.getenv('SETTINGS_CACHE_TTL', 300))
+
+# Ommabop kinolar keshi (LRU) va mavjud bo'lmagan kodlar keshi
+MOVIE_CACHE_SIZE = int(os.getenv('MOVIE_CACHE_SIZE', 5000))
+MOVIE_NEGATIVE_CACHE_SIZE = int(os.getenv('MOVIE_NEGATIVE_CACHE_SIZE', 2000))
+
+# Majburiy obuna tekshiruvi keshi: obuna bo'lganlar uzoqroq, bo'lmaganlar qisqa saqlanadi
+SUB_CACHE_TTL = int(os.getenv('SUB_CACHE_TTL', 600))
+SUB_CACHE_NEGATIVE_TTL = int(os.getenv('SUB_CACHE_NEGATIVE_TTL', 30))
+SUB_CACHE_MAXSIZE = int(os.getenv('SUB_CACHE_MAXSIZE', 100000))
+
+# Ommaviy xabar yuborish (Telegram: ~30 xabar/soniya umumiy, 1 xabar/soniya bitta chatga)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', 1.0))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 20))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 500))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))  # soniya
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+# retry_after kutishlari alohida hisoblanadi (vaqtinchalik xatolar limitini yemaydi)
+BROADCAST_MAX_FLOOD_WAITS = int(os.getenv('BROADCAST_MAX_FLOOD_WAITS', 50))
+
+# Qidiruv natijalari: bir sahifadagi kinolar soni
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 10))
+
+# /listmovies: bir sahifadagi kinolar soni
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 20))
+
+# Foydalanuvchi so'rovlarini cheklash (token bucket: soniyasiga so'rov va zaxira)
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', 1))
+THROTTLE_BURST = float(os.getenv('THROTTLE_BURST', 5))
+THROTTLE_ADMIN_RATE = float(os.getenv('THROTTLE_ADMIN_RATE', 5))
+THROTTLE_ADMIN_BURST = float(os.getenv('THROTTLE_ADMIN_BURST', 20))
+THROTTLE_DEBOUNCE = float(os.getenv('THROTTLE_DEBOUNCE', 2))  # bir xil so'rov takrori, soniya
+THROTTLE_NOTICE_WINDOW = float(os.getenv('THROTTLE_NOTICE_WINDOW', 10))  # ogohlantirish oralig'i
+THROTTLE_MAX_USERS = int(os.getenv('THROTTLE_MAX_USERS', 100000))
+THROTTLE_IDLE_TTL = float(os.getenv('THROTTLE_IDLE_TTL', 600))
+
+# Reklamalar jadvalini bazadan qayta o'qish oralig'i (daqiqa)
+ADS_SYNC_INTERVAL = int(os.getenv('ADS_SYNC_INTERVAL', 10))
+
+# Ishga tushirish rejimi: "polling" yoki "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+
+# Webhook sozlamalari (BOT_MODE=webhook bo'lganda)
+# WEBHOOK_URL bo'sh bo'lsa, set_webhook chaqirilmaydi (lokal sinov uchun)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+# FSM holatlari saqlanadigan joy: "memory", "sqlite" yoki "redis"
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite').lower()
+FSM_DATABASE_FILE = os.getenv('FSM_DATABASE_FILE', DATABASE_FILE)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Bir nechta bot jarayoni (webhook orqasida):
+# CACHE_SYNC_INTERVAL > 0 — keshlar cache_events jadvali orqali shu oraliqda (soniya) sinxronlanadi
+CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', 0))
+# Reklamalar va to'xtab qolgan ommaviy xabarlarni faqat asosiy jarayon bajaradi
+PRIMARY_WORKER = os.getenv('PRIMARY_WORKER', 'true').lower() == 'true'
+
+# Texnik xizmat (faqat asosiy jarayonda): har kuni ARCHIVE_TIME da ("HH:MM", bo'sh — o'chirilgan)
+# o'chirilgan kinolar va bloklagan / ARCHIVE_INACTIVE_DAYS kundan beri faol bo'lmagan
+# foydalanuvchilar arxiv jadvallariga ko'chiriladi (0 — faqat bloklaganlar), keyin baza siqiladi
+ARCHIVE_TIME = os.getenv('ARCHIVE_TIME', '04:00')
+ARCHIVE_INACTIVE_DAYS = int(os.getenv('ARCHIVE_INACTIVE_DAYS', 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+# Bir martada bo'shatiladigan sahifalar soni (incremental_vacuum)
+VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', 10000))
+
+# Metrikalar: Prometheus matni webhook serverida METRICS_PATH da (bo'sh — o'chirilgan),
+# METRICS_LOG_INTERVAL daqiqada bir qisqa hisobot logga yoziladi (0 — yozilmaydi)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_PATH = os.getenv('METRICS_PATH', '/metrics')
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', 0))
 
 # Bot sozlamalari
 DEFAULT_SETTINGS = {
     "force_subscribe": "true",
     "notification_new_user": "true"
 }
+
+
+# Sozlamalarni tekshirish: topilgan xatolar ro'yxati (bo'sh — hammasi joyida)
+def validate() -> list:
+    errors = []
+    if not BOT_TOKEN or not re.fullmatch(r'\d+:[\w-]+', BOT_TOKEN):
+        errors.append("BOT_TOKEN .env da to'ldirilmagan yoki noto'g'ri")
+    if MAIN_ADMIN == 0:
+        errors.append("MAIN_ADMIN .env da to'ldirilmagan")
+    if BOT_MODE not in ('polling', 'webhook'):
+        errors.append(f"BOT_MODE noma'lum: {BOT_MODE} (polling yoki webhook)")
+    if BOT_MODE == 'webhook' and not WEBHOOK_PATH.startswith('/'):
+        errors.append("WEBHOOK_PATH '/' bilan boshlanishi kerak")
+    # sirsiz ochiq webhook ga istalgan kishi MAIN_ADMIN nomidan update yubora oladi
+    # (WEBHOOK_URL bo'sh — lokal sinov, tekshirilmaydi)
+    if BOT_MODE == 'webhook' and WEBHOOK_URL and not WEBHOOK_SECRET:
+        errors.append("BOT_MODE=webhook va WEBHOOK_URL berilganda WEBHOOK_SECRET majburiy")
+    if FSM_STORAGE not in ('memory', 'sqlite', 'redis'):
+        errors.append(f"FSM_STORAGE noma'lum: {FSM_STORAGE} (memory, sqlite yoki redis)")
+    elif FSM_STORAGE == 'redis' and importlib.util.find_spec('redis') is None:
+        errors.append("FSM_STORAGE=redis uchun 'redis' paketini o'rnating")
+    if ARCHIVE_TIME and not re.fullmatch(r'([01]?\d|2[0-3]):[0-5]\d', ARCHIVE_TIME):
+        errors.append(f"ARCHIVE_TIME HH:MM ko'rinishida bo'lishi kerak: {ARCHIVE_TIME}")
+    return errors
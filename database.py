@@ -1,211 +1,917 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import uuid
+from contextlib import asynccontextmanager
+
 import aiosqlite
-from config import DATABASE_FILE, MAIN_ADMIN, DEFAULT_SETTINGS
+from config import (
+    DATABASE_FILE, MAIN_ADMIN, DEFAULT_SETTINGS,
+    DB_READ_POOL_SIZE, DB_MMAP_SIZE, DB_CACHE_SIZE, DB_BUSY_TIMEOUT_MS,
+    VIEWS_FLUSH_THRESHOLD, SETTINGS_CACHE_TTL, MOVIE_CACHE_SIZE, MOVIE_NEGATIVE_CACHE_SIZE,
+    CACHE_SYNC_INTERVAL, USERS_FLUSH_THRESHOLD, ARCHIVE_BATCH_SIZE, VACUUM_PAGES,
+)
+from cache import TTLCache, LRUCache, MISSING
+from delivery import guess_media_type
+from search import build_match_query
+from migrations import MIGRATIONS, SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+MOVIE_COLUMNS = 'code, title, format, language, file_id, views, is_deleted, media_type, broken'
+
+# Keyingi kino kodi: arxivga ko'chirilgan kodlar ham qayta ishlatilmaydi
+_NEXT_CODE = '''MAX(
+    COALESCE((SELECT MAX(code) FROM movies), 0),
+    COALESCE((SELECT MAX(code) FROM movies_archive), 0)
+) + 1'''
+
+
+# Bazani tez tekshirish (--check uchun, event loop va aiosqlite siz):
+# (xatolar, izohlar) — bazaga hech narsa yozilmaydi
+def check_database(db_file: str = DATABASE_FILE) -> tuple:
+    if not os.path.exists(db_file):
+        return [], [f"{db_file} hali yo'q — birinchi ishga tushishda yaratiladi"]
+    try:
+        conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return [f"{db_file} o'qilmadi: {e}"], []
+    if version > SCHEMA_VERSION:
+        return [f"Baza versiyasi ({version}) koddagidan ({SCHEMA_VERSION}) yangi — kod eskirgan"], []
+    if version < SCHEMA_VERSION:
+        return [], [f"{SCHEMA_VERSION - version} ta migratsiya ishga tushishda bajariladi"]
+    return [], [f"Baza versiyasi: {version}"]
+
+
+# Kino yozuvi (tuple o'rniga ixcham __slots__ obyekt)
+class Movie:
+    __slots__ = ('code', 'title', 'format', 'language', 'file_id', 'views', 'is_deleted', 'media_type', 'broken')
+
+    def __init__(self, code, title, format, language, file_id, views=0, is_deleted=0,
+                 media_type=None, broken=None):
+        self.code = code
+        self.title = title
+        self.format = format
+        self.language = language
+        self.file_id = file_id
+        self.views = views or 0
+        self.is_deleted = is_deleted
+        self.media_type = media_type
+        self.broken = broken
+
+    def copy(self, **changes) -> 'Movie':
+        movie = Movie(*(getattr(self, name) for name in self.__slots__))
+        for name, value in changes.items():
+            setattr(movie, name, value)
+        return movie
+
+    def __repr__(self):
+        return f"Movie(code={self.code!r}, title={self.title!r}, views={self.views!r})"
 
 class Database:
-    def __init__(self):
-        self.db_file = DATABASE_FILE
-
-    async def create_tables(self):
-        async with aiosqlite.connect(self.db_file) as db:
-            # Foydalanuvchilar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    fullname TEXT,
-                    joined_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Kinolar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS movies (
-                    code INTEGER PRIMARY KEY,
-                    title TEXT,
-                    format TEXT,
-                    language TEXT,
-                    file_id TEXT,
-                    views INTEGER DEFAULT 0,
-                    is_deleted INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Kanallar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS channels (
-                    username TEXT PRIMARY KEY
-                )
-            ''')
-            
-            # Reklamalar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS ads (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    image_file_id TEXT,
-                    text TEXT,
-                    button_text TEXT,
-                    button_url TEXT,
-                    schedule_time TEXT,
-                    repeat_count INTEGER
-                )
-            ''')
-            
-            # Adminlar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS admins (
-                    user_id INTEGER PRIMARY KEY
-                )
-            ''')
-            
-            # Sozlamalar jadvali
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
-            
-            await db.commit()
+    def __init__(self, db_file: str = DATABASE_FILE, read_pool_size: int = DB_READ_POOL_SIZE):
+        self.db_file = db_file
+        self.read_pool_size = max(1, read_pool_size)
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = None
+        self._reader_conns = []
+        # Hali bazaga yozilmagan ko'rishlar: {code: delta}
+        self._pending_views = {}
+        self._pending_total = 0
+        # Ayni paytda yozilayotgan (commit kutilayotgan) ko'rishlar
+        self._flushing_views = {}
+        # Ro'yxatdan o'tish navbati: {user_id: (username, fullname)}
+        self._pending_users = {}
+        # Yangi foydalanuvchilar yozilgandan keyin chaqiriladi: async fn([(id, username, fullname), ...])
+        self.on_new_users = None
+        # Hali yozilmagan faol foydalanuvchilar (kunlik statistika uchun)
+        self._active_users = set()
+        # Kam o'zgaradigan ma'lumotlar keshi (sozlamalar, kanallar, adminlar)
+        self._cache = TTLCache(SETTINGS_CACHE_TTL)
+        # Ommabop kinolar (kod -> Movie, bazadagi ko'rishlar bilan) va topilmagan kodlar
+        self._movies = LRUCache(MOVIE_CACHE_SIZE)
+        self._missing_movies = LRUCache(MOVIE_NEGATIVE_CACHE_SIZE)
+        # Kino yozuvlari o'zgarganda oshadi — eskirgan o'qish keshga yozilmasligi uchun
+        self._movies_generation = 0
+        # Jarayonlararo kesh bekor qilish kanali (cache_events jadvali)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._last_event_id = 0
+
+    # Ulanishni sozlash (WAL + pragmalar)
+    async def _open(self, readonly: bool = False) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_file)
+        await conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+        if not readonly:
+            # yangi bazada bo'sh sahifalar optimize() da qismlab bo'shatiladi
+            await conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        await conn.execute('PRAGMA journal_mode = WAL')
+        await conn.execute('PRAGMA synchronous = NORMAL')
+        await conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        await conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+        await conn.execute('PRAGMA temp_store = MEMORY')
+        if readonly:
+            await conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    # Ulanishlarni ochish (bot ishga tushganda bir marta)
+    async def connect(self):
+        if self._writer is not None:
+            return
+        # Yozuvchi birinchi ochiladi — fayl va WAL rejimi shu yerda yaratiladi
+        self._writer = await self._open()
+        self._readers = asyncio.Queue()
+        for _ in range(self.read_pool_size):
+            conn = await self._open(readonly=True)
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
+
+    # Ulanishlarni yopish (bot to'xtaganda)
+    async def close(self):
+        if self._writer is None:
+            return
+        await self.flush()
+        async with self._write_lock:
+            await self._writer.commit()
+            await self._writer.close()
+            self._writer = None
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns = []
+        self._readers = None
+
+    # O'qish uchun hovuzdan ulanish olish
+    @asynccontextmanager
+    async def _read(self):
+        if self._readers is None:
+            raise RuntimeError("Database.connect() chaqirilmagan")
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    # flush_* metodlari uchun yozish qulfi (tranzaksiyani o'zlari boshqaradi:
+    # xatoda buferni tiklash kerak); metrikalar shu orqali yozuvlarni sanaydi
+    def _flush_writer(self):
+        return self._write_lock
+
+    # Yozish uchun yagona ulanish (tranzaksiya: commit yoki rollback)
+    # immediate=True — yozish qulfi darhol olinadi (boshqa jarayonlar bilan poyga bo'lmasligi uchun)
+    @asynccontextmanager
+    async def _write(self, immediate: bool = False):
+        if self._writer is None:
+            raise RuntimeError("Database.connect() chaqirilmagan")
+        async with self._write_lock:
+            try:
+                if immediate:
+                    await self._writer.execute('BEGIN IMMEDIATE')
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
 
-    # Foydalanuvchi qo'shish
+    # Sxemani oxirgi versiyaga keltirish (ishga tushganda, idempotent)
+    async def migrate(self):
+        async with self._read() as db:
+            cursor = await db.execute('PRAGMA user_version')
+            current = (await cursor.fetchone())[0]
+        for version, step in MIGRATIONS:
+            if version <= current:
+                continue
+            async with self._write(immediate=True) as db:
+                # boshqa jarayon shu paytda yangilab qo'ygan bo'lishi mumkin
+                cursor = await db.execute('PRAGMA user_version')
+                if (await cursor.fetchone())[0] >= version:
+                    continue
+                await step(db)
+                await db.execute(f'PRAGMA user_version = {version}')
+            logger.info("Sxema %s-versiyaga yangilandi", version)
+        async with self._read() as db:
+            cursor = await db.execute('SELECT COALESCE(MAX(id), 0) FROM cache_events')
+            self._last_event_id = (await cursor.fetchone())[0]
+
+    # Ishga tushganda sozlamalar, kanallar va adminlar keshini oldindan to'ldirish
+    async def warm_cache(self):
+        await asyncio.gather(
+            *(self.get_setting(key) for key in DEFAULT_SETTINGS),
+            self.get_channels(),
+            self.get_admins(),
+        )
+
+    # Foydalanuvchi qo'shish (navbatga; bir foydalanuvchining takrorlari birlashtiriladi)
     async def add_user(self, user_id: int, username: str, fullname: str):
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.execute(
-                'INSERT OR IGNORE INTO users (id, username, fullname) VALUES (?, ?, ?)',
-                (user_id, username, fullname)
+        self._pending_users[user_id] = (username, fullname)
+        if len(self._pending_users) >= USERS_FLUSH_THRESHOLD:
+            await self.flush_users()
+
+    # Navbatdagi foydalanuvchilarni bitta tranzaksiyada upsert qilish
+    async def flush_users(self):
+        if not self._pending_users or self._writer is None:
+            return
+        async with self._flush_writer():
+            pending, self._pending_users = self._pending_users, {}
+            ids = list(pending)
+            try:
+                # haqiqatan yangi foydalanuvchilarni aniqlash uchun
+                existing = set()
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    cursor = await self._writer.execute(
+                        f'SELECT id FROM users WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+                    )
+                    existing.update(row[0] for row in await cursor.fetchall())
+                # arxivdagi foydalanuvchi qaytdi — eski yozuvi tiklanadi (yangi hisoblanmaydi)
+                existing |= await self._restore_users([uid for uid in ids if uid not in existing])
+                await self._writer.executemany(
+                    '''INSERT INTO users (id, username, fullname, last_seen)
+                       VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT(id) DO UPDATE SET
+                           username = excluded.username,
+                           fullname = excluded.fullname,
+                           last_seen = excluded.last_seen,
+                           is_blocked = 0''',
+                    [(uid, username, fullname) for uid, (username, fullname) in pending.items()]
+                )
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                for uid, profile in pending.items():
+                    self._pending_users.setdefault(uid, profile)
+                raise
+        new_users = [(uid, *pending[uid]) for uid in ids if uid not in existing]
+        if new_users and self.on_new_users is not None:
+            try:
+                await self.on_new_users(new_users)
+            except Exception:
+                logger.exception("Yangi foydalanuvchilar haqida xabar berilmadi")
+
+    # Arxivdagi foydalanuvchilarni users ga qaytarish (flush_* tranzaksiyasi ichida), tiklanganlar id lari
+    async def _restore_users(self, ids: list) -> set:
+        restored = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ", ".join("?" * len(chunk))
+            cursor = await self._writer.execute(
+                f'''INSERT INTO users (id, username, fullname, joined_date, last_seen, is_blocked)
+                    SELECT id, username, fullname, joined_date, last_seen, 0
+                    FROM users_archive WHERE id IN ({marks}) AND id NOT IN (SELECT id FROM users)
+                    RETURNING id''', chunk
+            )
+            restored.update(row[0] for row in await cursor.fetchall())
+            await self._writer.execute(f'DELETE FROM users_archive WHERE id IN ({marks})', chunk)
+        if restored:
+            # users_counter_ai ularni bugungi yangi foydalanuvchilarga qo'shib qo'ygan
+            await self._writer.execute(
+                "UPDATE daily_stats SET new_users = new_users - ? WHERE day = date('now')",
+                (len(restored),)
             )
-            await db.commit()
+        return restored
 
-    # Kino qo'shish
-    async def add_movie(self, title: str, format: str, language: str, file_id: str) -> int:
-        async with aiosqlite.connect(self.db_file) as db:
-            cursor = await db.execute('SELECT MAX(code) FROM movies')
-            result = await cursor.fetchone()
-            next_code = (result[0] or 0) + 1
-            
-            await db.execute(
-                'INSERT INTO movies (code, title, format, language, file_id) VALUES (?, ?, ?, ?, ?)',
-                (next_code, title, format, language, file_id)
+    # Kino qo'shish (kod bitta INSERT ... RETURNING ichida ajratiladi)
+    async def add_movie(self, title: str, format: str, language: str, file_id: str, media_type: str = None) -> int:
+        async with self._write(immediate=True) as db:
+            cursor = await db.execute(
+                f'''INSERT INTO movies (code, title, format, language, file_id, media_type)
+                    VALUES ({_NEXT_CODE}, ?, ?, ?, ?, ?) RETURNING code''',
+                (title, format, language, file_id, media_type)
+            )
+            code = (await cursor.fetchone())[0]
+            await self._publish(db, 'movie', code)
+        self._invalidate('movie', code)
+        return code
+
+    # Ko'p kinoni bitta tranzaksiyada qo'shish, (birinchi_kod, oxirgi_kod) qaytaradi
+    async def add_movies_bulk(self, movies: list) -> tuple:
+        if not movies:
+            return None
+        async with self._write(immediate=True) as db:
+            cursor = await db.execute(f'SELECT {_NEXT_CODE}')
+            first_code = (await cursor.fetchone())[0]
+            # kanal havolasi bo'lgan file_id lar copy_message orqali yuboriladi
+            await db.executemany(
+                'INSERT INTO movies (code, title, format, language, file_id, media_type) VALUES (?, ?, ?, ?, ?, ?)',
+                [(first_code + i, *movie, guess_media_type(movie[3])) for i, movie in enumerate(movies)]
+            )
+            await self._publish(db, 'movies')
+        # yangi kodlar avval "topilmadi" deb keshlangan bo'lishi mumkin
+        self._invalidate('movies')
+        return first_code, first_code + len(movies) - 1
+
+    # Kino faylini almashtirish (yaroqsiz belgisi olib tashlanadi)
+    async def set_movie_file(self, code: int, file_id: str, media_type: str = None) -> bool:
+        async with self._write() as db:
+            cursor = await db.execute(
+                'UPDATE movies SET file_id = ?, media_type = ?, broken = NULL WHERE code = ? AND is_deleted = 0',
+                (file_id, media_type, code)
             )
-            await db.commit()
-            return next_code
+            await self._publish(db, 'movie', code)
+        self._invalidate('movie', code)
+        return cursor.rowcount > 0
+
+    # Birinchi muvaffaqiyatli yuborishda aniqlangan turni saqlash
+    async def set_movie_media(self, code: int, media_type: str):
+        async with self._write() as db:
+            await db.execute('UPDATE movies SET media_type = ?, broken = NULL WHERE code = ?', (media_type, code))
+            await self._publish(db, 'movie', code)
+        self._invalidate('movie', code)
+
+    # file_id yaroqsiz: keyingi so'rovlar API ga murojaat qilmaydi
+    async def mark_movie_broken(self, code: int, error: str):
+        async with self._write() as db:
+            await db.execute('UPDATE movies SET broken = ? WHERE code = ?', (error[:200], code))
+            await self._publish(db, 'movie', code)
+        self._invalidate('movie', code)
+
+    # Yaroqsiz fayli bor kinolar (admin hisoboti uchun)
+    async def get_broken_movies(self, limit: int = 50) -> list:
+        async with self._read() as db:
+            cursor = await db.execute(
+                f'''SELECT {MOVIE_COLUMNS} FROM movies
+                    WHERE broken IS NOT NULL AND is_deleted = 0 ORDER BY code LIMIT ?''',
+                (limit,)
+            )
+            return [Movie(*row) for row in await cursor.fetchall()]
+
+    async def count_broken_movies(self) -> int:
+        async with self._read() as db:
+            cursor = await db.execute('SELECT COUNT(*) FROM movies WHERE broken IS NOT NULL AND is_deleted = 0')
+            return (await cursor.fetchone())[0]
 
     # Kino o'chirish
     async def delete_movie(self, code: int):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('UPDATE movies SET is_deleted = 1 WHERE code = ?', (code,))
-            await db.commit()
+            await self._publish(db, 'movie', code)
+        self._invalidate('movie', code)
+
+    # Keshni bekor qilish: scope — 'setting', 'channels', 'admins', 'movie' yoki 'movies'
+    # ('views' hodisasi bekor qilmaydi — sync_cache keshdagi ko'rishlarni yangilaydi)
+    def _invalidate(self, scope: str, key=None):
+        if scope == 'setting':
+            self._cache.invalidate(('setting', key))
+        elif scope in ('channels', 'admins'):
+            self._cache.invalidate(scope)
+        elif scope == 'movie':
+            code = int(key)
+            self._movies_generation += 1
+            self._movies.pop(code)
+            self._missing_movies.pop(code)
+        elif scope == 'movies':
+            self._movies_generation += 1
+            self._missing_movies.clear()
 
-    # Ko'rishlar sonini oshirish
+    # O'zgarishni boshqa jarayonlarga e'lon qilish (yozish tranzaksiyasi ichida)
+    async def _publish(self, db, scope: str, key=None):
+        if CACHE_SYNC_INTERVAL > 0:
+            await db.execute(
+                'INSERT INTO cache_events (scope, key, origin) VALUES (?, ?, ?)',
+                (scope, None if key is None else str(key), self.worker_id)
+            )
+
+    # Boshqa jarayonlar e'lon qilgan o'zgarishlarni o'qib, keshni tozalash
+    async def sync_cache(self):
+        if self._readers is None:
+            return
+        async with self._read() as db:
+            cursor = await db.execute(
+                'SELECT id, scope, key, origin FROM cache_events WHERE id > ? ORDER BY id',
+                (self._last_event_id,)
+            )
+            events = await cursor.fetchall()
+        refresh_views = False
+        for event_id, scope, key, origin in events:
+            self._last_event_id = event_id
+            if origin == self.worker_id:
+                continue
+            if scope == 'views':
+                refresh_views = True
+            else:
+                self._invalidate(scope, key)
+        if refresh_views:
+            await self._refresh_movie_views()
+
+    # Boshqa jarayon ko'rishlarni yozgan — keshdagi kinolarning views qiymatini bazadan yangilash
+    async def _refresh_movie_views(self):
+        codes = self._movies.keys()
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            generation = self._movies_generation
+            async with self._read() as db:
+                cursor = await db.execute(
+                    f'SELECT code, views FROM movies WHERE code IN ({", ".join("?" * len(chunk))})', chunk
+                )
+                rows = await cursor.fetchall()
+            # o'qish davomida o'z flush_views imiz yozgan bo'lsa, qiymatlar eskirgan bo'lishi mumkin
+            if generation != self._movies_generation:
+                continue
+            for code, views in rows:
+                movie = self._movies.peek(code)
+                if movie is not MISSING:
+                    movie.views = views
+
+    # Eski kesh hodisalarini o'chirish
+    async def prune_cache_events(self, max_age_minutes: int = 60):
+        async with self._write() as db:
+            await db.execute(
+                "DELETE FROM cache_events WHERE created_at < datetime('now', ?)",
+                (f'-{max_age_minutes} minutes',)
+            )
+
+    # Ko'rishlar sonini oshirish (xotirada yig'iladi, flush_views yozadi)
     async def increment_views(self, code: int):
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.execute('UPDATE movies SET views = views + 1 WHERE code = ?', (code,))
-            await db.commit()
+        self._pending_views[code] = self._pending_views.get(code, 0) + 1
+        self._pending_total += 1
+        if self._pending_total >= VIEWS_FLUSH_THRESHOLD:
+            await self.flush_views()
+
+    # Yig'ilgan ko'rishlarni bitta tranzaksiyada bazaga yozish
+    async def flush_views(self):
+        if not self._pending_views or self._writer is None:
+            return
+        async with self._flush_writer():
+            pending, self._pending_views = self._pending_views, {}
+            self._pending_total = 0
+            self._flushing_views = pending
+            try:
+                await self._writer.executemany(
+                    'UPDATE movies SET views = views + ? WHERE code = ?',
+                    [(delta, code) for code, delta in pending.items()]
+                )
+                # Hisoblagich va kunlik statistika shu tranzaksiyada yangilanadi
+                await self._writer.executemany(
+                    '''INSERT INTO movie_daily_views (day, code, views) VALUES (date('now'), ?, ?)
+                       ON CONFLICT(day, code) DO UPDATE SET views = views + excluded.views''',
+                    list(pending.items())
+                )
+                total = sum(pending.values())
+                await self._writer.execute(
+                    "UPDATE counters SET value = value + ? WHERE name = 'total_views'", (total,)
+                )
+                await self._writer.execute(
+                    '''INSERT INTO daily_stats (day, views) VALUES (date('now'), ?)
+                       ON CONFLICT(day) DO UPDATE SET views = views + excluded.views''',
+                    (total,)
+                )
+                await self._publish(self._writer, 'views')
+                # commit ko'rinishi bilan parallel get_movie o'qigan qator keshga tushmasin
+                self._movies_generation += 1
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                # Yozilmagan ko'rishlar yo'qolmasligi uchun qaytarib qo'yamiz
+                for code, delta in pending.items():
+                    self._pending_views[code] = self._pending_views.get(code, 0) + delta
+                    self._pending_total += delta
+                raise
+            else:
+                # Keshdagi yozuvlar bazadagi qiymat bilan bir xil bo'lib qolishi kerak
+                for code, delta in pending.items():
+                    movie = self._movies.peek(code)
+                    if movie is not MISSING:
+                        movie.views += delta
+            finally:
+                self._flushing_views = {}
+
+    # Foydalanuvchi faolligini qayd etish (xotirada, flush_activity yozadi)
+    def record_activity(self, user_id: int):
+        self._active_users.add(user_id)
+
+    # Bugungi faol foydalanuvchilarni bazaga yozish (kunlik faol foydalanuvchilar soni)
+    async def flush_activity(self):
+        if not self._active_users or self._writer is None:
+            return
+        async with self._flush_writer():
+            active, self._active_users = self._active_users, set()
+            try:
+                # jadval faqat bugungi takrorlarni ajratish uchun — kechagi qatorlar kerak emas
+                # (PRIMARY KEY (day, user_id) bo'yicha diapazon, yangi kunda birinchi flush dan keyin bo'sh)
+                await self._writer.execute("DELETE FROM daily_active_users WHERE day < date('now')")
+                before = self._writer.total_changes
+                await self._writer.executemany(
+                    "INSERT OR IGNORE INTO daily_active_users (day, user_id) VALUES (date('now'), ?)",
+                    [(uid,) for uid in active]
+                )
+                # faqat bugun birinchi marta ko'ringanlar hisoblanadi
+                new_active = self._writer.total_changes - before
+                # /start siz qaytgan arxivdagi foydalanuvchi ham tiklanadi (aks holda UPDATE 0 qator)
+                await self._restore_users(list(active))
+                await self._writer.executemany(
+                    'UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE id = ?',
+                    [(uid,) for uid in active]
+                )
+                if new_active:
+                    await self._writer.execute(
+                        '''INSERT INTO daily_stats (day, active_users) VALUES (date('now'), ?)
+                           ON CONFLICT(day) DO UPDATE SET active_users = active_users + excluded.active_users''',
+                        (new_active,)
+                    )
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                self._active_users |= active
+                raise
+
+    # Barcha kechiktirilgan yozuvlarni bazaga yozish (scheduler va close() chaqiradi)
+    async def flush(self):
+        await self.flush_users()
+        await self.flush_views()
+        await self.flush_activity()
+
+    # Kino uchun hali yozilmagan ko'rishlar soni
+    def pending_views(self, code: int) -> int:
+        return self._pending_views.get(code, 0) + self._flushing_views.get(code, 0)
+
+    # Bazadagi qatorni Movie ga aylantirish (yozilmagan ko'rishlar bilan)
+    def _movie(self, row):
+        if row is None:
+            return None
+        movie = Movie(*row)
+        movie.views += self.pending_views(movie.code)
+        return movie
 
-    # Kino ma'lumotlarini olish
+    # Kino ma'lumotlarini olish (avval LRU keshdan)
     async def get_movie(self, code: int):
-        async with aiosqlite.connect(self.db_file) as db:
+        movie = self._movies.get(code)
+        if movie is not MISSING:
+            return movie.copy(views=movie.views + self.pending_views(code))
+        if self._missing_movies.get(code) is not MISSING:
+            return None
+        generation = self._movies_generation
+        async with self._read() as db:
             cursor = await db.execute(
-                'SELECT * FROM movies WHERE code = ? AND is_deleted = 0',
+                f'SELECT {MOVIE_COLUMNS} FROM movies WHERE code = ? AND is_deleted = 0',
                 (code,)
             )
-            return await cursor.fetchone()
+            row = await cursor.fetchone()
+        if generation == self._movies_generation:
+            if row is None:
+                self._missing_movies.set(code, True)
+            else:
+                self._movies.set(code, Movie(*row))
+        return self._movie(row)
+
+    # Kino keshi statistikasi
+    def movie_cache_stats(self) -> dict:
+        return {
+            'size': len(self._movies),
+            'hits': self._movies.hits,
+            'misses': self._movies.misses,
+            'negative_size': len(self._missing_movies),
+            'negative_hits': self._missing_movies.hits,
+        }
+
+    # Kinolarni nomi/tili/formati bo'yicha qidirish (bm25 bo'yicha saralangan)
+    async def search_movies(self, query: str, limit: int = 10, offset: int = 0) -> list:
+        match = build_match_query(query)
+        if not match:
+            return []
+        async with self._read() as db:
+            cursor = await db.execute(
+                f'''WITH hits AS (
+                       SELECT rowid, bm25(movies_fts, 10.0, 2.0, 1.0) AS rank
+                       FROM movies_fts WHERE movies_fts MATCH ?
+                   )
+                   SELECT {MOVIE_COLUMNS} FROM hits
+                   JOIN movies ON movies.code = hits.rowid
+                   WHERE is_deleted = 0
+                   ORDER BY hits.rank
+                   LIMIT ? OFFSET ?''',
+                (match, limit, offset)
+            )
+            return [self._movie(row) for row in await cursor.fetchall()]
+
+    # Kinolar ro'yxati sahifasi (keyset pagination)
+    # sort: 'code' — kod bo'yicha, 'new' — eng yangilari, 'top' — eng ko'p ko'rilganlar
+    # cursor: 'code'/'new' uchun kod, 'top' uchun (views, code); backward=True — oldingi sahifa
+    async def get_movies_page(self, sort: str = 'code', cursor=None, limit: int = 20, backward: bool = False) -> list:
+        if sort == 'top':
+            key, order = '(views, code)', ('views DESC, code DESC', 'views ASC, code ASC')
+            op = ('<', '>')
+            params = tuple(cursor) if cursor is not None else ()
+            placeholder = '(?, ?)'
+        else:
+            key, placeholder = 'code', '?'
+            params = (cursor,) if cursor is not None else ()
+            if sort == 'new':
+                order, op = ('code DESC', 'code ASC'), ('<', '>')
+            else:
+                order, op = ('code ASC', 'code DESC'), ('>', '<')
+        i = 1 if backward else 0
+        where = 'is_deleted = 0'
+        if cursor is not None:
+            where += f' AND {key} {op[i]} {placeholder}'
+        async with self._read() as db:
+            cursor_ = await db.execute(
+                f'SELECT {MOVIE_COLUMNS} FROM movies WHERE {where} ORDER BY {order[i]} LIMIT ?',
+                params + (limit,)
+            )
+            rows = [self._movie(row) for row in await cursor_.fetchall()]
+        if backward:
+            rows.reverse()
+        return rows
 
-    # Adminlar ro'yxatini olish
-    async def get_admins(self) -> list:
-        async with aiosqlite.connect(self.db_file) as db:
+    # Adminlar to'plamini olish (keshlangan, O(1) tekshiruv uchun set)
+    async def get_admins(self) -> frozenset:
+        admins = self._cache.get('admins')
+        if admins is not MISSING:
+            return admins
+        generation = self._cache.generation
+        async with self._read() as db:
             cursor = await db.execute('SELECT user_id FROM admins')
-            return [row[0] for row in await cursor.fetchall()]
+            admins = frozenset(row[0] for row in await cursor.fetchall())
+        self._cache.set('admins', admins, generation)
+        return admins
 
     # Admin qo'shish
     async def add_admin(self, user_id: int):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('INSERT OR IGNORE INTO admins (user_id) VALUES (?)', (user_id,))
-            await db.commit()
+            await self._publish(db, 'admins')
+        self._invalidate('admins')
 
     # Adminni o'chirish
     async def remove_admin(self, user_id: int):
         if user_id != MAIN_ADMIN:
-            async with aiosqlite.connect(self.db_file) as db:
+            async with self._write() as db:
                 await db.execute('DELETE FROM admins WHERE user_id = ?', (user_id,))
-                await db.commit()
+                await self._publish(db, 'admins')
+            self._invalidate('admins')
 
     # Kanal qo'shish
     async def add_channel(self, username: str):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('INSERT OR REPLACE INTO channels (username) VALUES (?)', (username,))
-            await db.commit()
+            await self._publish(db, 'channels')
+        self._invalidate('channels')
 
     # Kanalni o'chirish
     async def remove_channel(self, username: str):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('DELETE FROM channels WHERE username = ?', (username,))
-            await db.commit()
+            await self._publish(db, 'channels')
+        self._invalidate('channels')
 
-    # Kanallar ro'yxatini olish
-    async def get_channels(self):
-        async with aiosqlite.connect(self.db_file) as db:
-            cursor = await db.execute('SELECT username FROM channels')
-            return [row[0] for row in await cursor.fetchall()]
+    # Kanallar ro'yxatini olish (keshlangan)
+    async def get_channels(self) -> list:
+        channels = self._cache.get('channels')
+        if channels is MISSING:
+            generation = self._cache.generation
+            async with self._read() as db:
+                cursor = await db.execute('SELECT username FROM channels')
+                channels = tuple(row[0] for row in await cursor.fetchall())
+            self._cache.set('channels', channels, generation)
+        return list(channels)
 
     # Reklama qo'shish
-    async def add_ad(self, image_file_id: str, text: str, button_text: str, button_url: str, schedule_time: str, repeat_count: int):
-        async with aiosqlite.connect(self.db_file) as db:
-            await db.execute('''
+    async def add_ad(self, image_file_id: str, text: str, button_text: str, button_url: str, schedule_time: str, repeat_count: int) -> int:
+        async with self._write() as db:
+            cursor = await db.execute('''
                 INSERT INTO ads (image_file_id, text, button_text, button_url, schedule_time, repeat_count)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (image_file_id, text, button_text, button_url, schedule_time, repeat_count))
-            await db.commit()
+            return cursor.lastrowid
 
     # Reklamani o'chirish
     async def delete_ad(self, ad_id: int):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('DELETE FROM ads WHERE id = ?', (ad_id,))
-            await db.commit()
 
     # Rejalashtirilgan reklamalarni olish
     async def get_scheduled_ads(self):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._read() as db:
             cursor = await db.execute('SELECT * FROM ads WHERE repeat_count > 0')
             return await cursor.fetchall()
 
     # Reklama takrorlanishlarini yangilash
     async def update_ad_count(self, ad_id: int, new_count: int):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('UPDATE ads SET repeat_count = ? WHERE id = ?', (new_count, ad_id))
-            await db.commit()
+
+    # Reklamani olish
+    async def get_ad(self, ad_id: int):
+        async with self._read() as db:
+            cursor = await db.execute('SELECT * FROM ads WHERE id = ?', (ad_id,))
+            return await cursor.fetchone()
+
+    # Reklama takrorlanishini atomar kamaytirish, qolgan sonni qaytaradi
+    async def decrement_ad_count(self, ad_id: int) -> int:
+        async with self._write() as db:
+            cursor = await db.execute(
+                'UPDATE ads SET repeat_count = repeat_count - 1 WHERE id = ? AND repeat_count > 0 RETURNING repeat_count',
+                (ad_id,)
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else 0
 
     # Statistika olish
     async def get_stats(self) -> dict:
-        async with aiosqlite.connect(self.db_file) as db:
-            stats = {}
-            
-            cursor = await db.execute('SELECT COUNT(*) FROM users')
-            stats['users'] = (await cursor.fetchone())[0]
-            
-            cursor = await db.execute('SELECT COUNT(*) FROM movies WHERE is_deleted = 0')
-            stats['movies'] = (await cursor.fetchone())[0]
-            
-            cursor = await db.execute('SELECT SUM(views) FROM movies')
-            stats['total_views'] = (await cursor.fetchone())[0] or 0
-            
-            return stats
-
-    # Sozlamalarni olish
+        # triggerlar yuritadigan hisoblagichlardan — jadval o'lchamidan qat'i nazar O(1)
+        async with self._read() as db:
+            cursor = await db.execute('SELECT name, value FROM counters')
+            counters = dict(await cursor.fetchall())
+        return {
+            'users': counters.get('users', 0),
+            'movies': counters.get('movies', 0),
+            'total_views': counters.get('total_views', 0)
+                + sum(self._pending_views.values()) + sum(self._flushing_views.values()),
+        }
+
+    # Oxirgi kunlar statistikasi: [(kun, yangi, faol, ko'rishlar), ...] — yangilari birinchi
+    async def get_daily_stats(self, days: int = 7) -> list:
+        async with self._read() as db:
+            cursor = await db.execute(
+                'SELECT day, new_users, active_users, views FROM daily_stats ORDER BY day DESC LIMIT ?',
+                (days,)
+            )
+            return await cursor.fetchall()
+
+    # Kun bo'yicha eng ko'p ko'rilgan kinolar: [(kod, ko'rishlar), ...]
+    async def get_top_movies_for_day(self, day: str = None, limit: int = 10) -> list:
+        async with self._read() as db:
+            cursor = await db.execute(
+                '''SELECT code, views FROM movie_daily_views WHERE day = COALESCE(?, date('now'))
+                   ORDER BY views DESC LIMIT ?''',
+                (day, limit)
+            )
+            return await cursor.fetchall()
+
+    # Sozlamalarni olish (keshlangan)
     async def get_setting(self, key: str) -> str:
-        async with aiosqlite.connect(self.db_file) as db:
+        value = self._cache.get(('setting', key))
+        if value is not MISSING:
+            return value
+        generation = self._cache.generation
+        async with self._read() as db:
             cursor = await db.execute('SELECT value FROM settings WHERE key = ?', (key,))
             result = await cursor.fetchone()
-            return result[0] if result else DEFAULT_SETTINGS.get(key)
+        value = result[0] if result else DEFAULT_SETTINGS.get(key)
+        self._cache.set(('setting', key), value, generation)
+        return value
 
     # Sozlamani o'zgartirish
     async def set_setting(self, key: str, value: str):
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._write() as db:
             await db.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
-            await db.commit()
+            await self._publish(db, 'setting', key)
+        self._invalidate('setting', key)
 
     # Foydalanuvchilar ro'yxatini olish
     async def get_all_users(self) -> list:
-        async with aiosqlite.connect(self.db_file) as db:
+        async with self._read() as db:
             cursor = await db.execute('SELECT id FROM users')
             return [row[0] for row in await cursor.fetchall()]
+
+    # Faol foydalanuvchilar ID'larini bo'laklab olish (keyset pagination)
+    async def get_user_ids_after(self, after_id: int, limit: int) -> list:
+        async with self._read() as db:
+            cursor = await db.execute(
+                'SELECT id FROM users WHERE id > ? AND is_blocked = 0 ORDER BY id LIMIT ?',
+                (after_id, limit)
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+    # Faol (botni bloklamagan) foydalanuvchilar soni
+    async def count_active_users(self) -> int:
+        async with self._read() as db:
+            cursor = await db.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 0')
+            return (await cursor.fetchone())[0]
+
+    # Botni bloklagan / o'chirilgan foydalanuvchilarni belgilash
+    async def mark_users_blocked(self, user_ids: list):
+        if not user_ids:
+            return
+        async with self._write() as db:
+            await db.executemany('UPDATE users SET is_blocked = 1 WHERE id = ?', [(uid,) for uid in user_ids])
+
+    # Ommaviy xabar yaratish
+    async def create_broadcast(self, text: str, admin_chat_id: int, total: int) -> int:
+        async with self._write() as db:
+            cursor = await db.execute(
+                'INSERT INTO broadcasts (text, admin_chat_id, total) VALUES (?, ?, ?)',
+                (text, admin_chat_id, total)
+            )
+            return cursor.lastrowid
+
+    # Ommaviy xabarni olish
+    async def get_broadcast(self, broadcast_id: int):
+        async with self._read() as db:
+            cursor = await db.execute(
+                '''SELECT id, text, admin_chat_id, progress_message_id, status,
+                          last_user_id, total, sent, failed, blocked
+                   FROM broadcasts WHERE id = ?''',
+                (broadcast_id,)
+            )
+            return await cursor.fetchone()
+
+    # Tugallanmagan ommaviy xabarlar ID'lari
+    async def get_unfinished_broadcasts(self) -> list:
+        async with self._read() as db:
+            cursor = await db.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+            return [row[0] for row in await cursor.fetchall()]
+
+    # Jarayon xabarining ID'sini saqlash
+    async def set_broadcast_message(self, broadcast_id: int, message_id: int):
+        async with self._write() as db:
+            await db.execute(
+                'UPDATE broadcasts SET progress_message_id = ? WHERE id = ?',
+                (message_id, broadcast_id)
+            )
+
+    # Ommaviy xabar jarayonini saqlash
+    async def update_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int, blocked: int):
+        async with self._write() as db:
+            await db.execute(
+                '''UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, blocked = ?
+                   WHERE id = ?''',
+                (last_user_id, sent, failed, blocked, broadcast_id)
+            )
+
+    # Ommaviy xabarni yakunlash
+    async def finish_broadcast(self, broadcast_id: int, status: str = 'done'):
+        async with self._write() as db:
+            await db.execute(
+                'UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (status, broadcast_id)
+            )
+
+    # O'chirilgan kinolarni bo'laklab arxivga ko'chirish, ko'chirilganlar sonini qaytaradi
+    async def archive_movies(self, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        total = 0
+        while True:
+            async with self._write(immediate=True) as db:
+                cursor = await db.execute('SELECT code FROM movies WHERE is_deleted = 1 LIMIT ?', (batch_size,))
+                codes = [row[0] for row in await cursor.fetchall()]
+                if codes:
+                    marks = ', '.join('?' * len(codes))
+                    await db.execute(
+                        f'''INSERT OR REPLACE INTO movies_archive
+                                (code, title, format, language, file_id, views, media_type, broken)
+                            SELECT code, title, format, language, file_id, views, media_type, broken
+                            FROM movies WHERE code IN ({marks})''', codes
+                    )
+                    await db.execute(f'DELETE FROM movies WHERE code IN ({marks})', codes)
+            if not codes:
+                return total
+            total += len(codes)
+            # bo'laklar orasida boshqa yozuvlarga navbat berish
+            await asyncio.sleep(0)
+
+    # Bloklagan va inactive_days kundan beri faol bo'lmagan foydalanuvchilarni arxivga ko'chirish
+    # (inactive_days=0 — faqat bloklaganlar). Adminlar va asosiy admin ko'chirilmaydi.
+    async def archive_users(self, inactive_days: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        where = 'is_blocked = 1'
+        if inactive_days > 0:
+            where += f" OR last_seen < datetime('now', '-{int(inactive_days)} days')"
+        total = 0
+        while True:
+            async with self._write(immediate=True) as db:
+                cursor = await db.execute(
+                    f'''SELECT id FROM users WHERE ({where})
+                        AND id != ? AND id NOT IN (SELECT user_id FROM admins) LIMIT ?''',
+                    (MAIN_ADMIN, batch_size)
+                )
+                ids = [row[0] for row in await cursor.fetchall()]
+                if ids:
+                    marks = ', '.join('?' * len(ids))
+                    await db.execute(
+                        f'''INSERT OR REPLACE INTO users_archive
+                                (id, username, fullname, joined_date, last_seen, is_blocked)
+                            SELECT id, username, fullname, joined_date, last_seen, is_blocked
+                            FROM users WHERE id IN ({marks})''', ids
+                    )
+                    await db.execute(f'DELETE FROM users WHERE id IN ({marks})', ids)
+            if not ids:
+                return total
+            total += len(ids)
+            await asyncio.sleep(0)
+
+    # Bazani siqish: bo'sh sahifalarni qismlab bo'shatish, WAL ni qisqartirish, statistikani yangilash.
+    # Eski (auto_vacuum siz) bazada birinchi marta to'liq VACUUM bajariladi.
+    async def optimize(self, vacuum_pages: int = VACUUM_PAGES) -> dict:
+        async with self._write() as db:
+            cursor = await db.execute('PRAGMA auto_vacuum')
+            mode = (await cursor.fetchone())[0]
+            cursor = await db.execute('PRAGMA freelist_count')
+            free_before = (await cursor.fetchone())[0]
+            if mode == 2:
+                cursor = await db.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})')
+                await cursor.fetchall()
+            else:
+                await db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                await db.execute('VACUUM')
+            await db.execute('PRAGMA optimize')
+            cursor = await db.execute('PRAGMA freelist_count')
+            free_after = (await cursor.fetchone())[0]
+        async with self._write() as db:
+            await db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return {'full_vacuum': mode != 2, 'freed_pages': free_before - free_after}
+
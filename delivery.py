@@ -0,0 +1,105 @@
+import logging
+import re
+
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+# Kinoning saqlangan turlari: file_id bo'yicha yuboriladi yoki saqlash kanalidan nusxa olinadi
+MEDIA_TYPES = ('video', 'document', 'animation', 'copy')
+
+# Turi noma'lum (eski yoki import qilingan) kinolar uchun sinash tartibi
+_GUESS_ORDER = ('video', 'document', 'animation')
+
+# "can't use file of type Document as Video" — haqiqiy turni xatodan bilib olish
+_FILE_TYPE = re.compile(r'file of type (\w+)', re.IGNORECASE)
+
+# Faylning o'zi yaroqsizligini bildiruvchi xatolar (boshqa BadRequest lar kinoga bog'liq emas)
+_MEDIA_ERRORS = ('file', 'message to copy not found', 'message_id_invalid')
+
+# Saqlash kanalidagi xabar: "-100123:45", "https://t.me/c/123/45" yoki "https://t.me/kanal/45"
+_REF_ID = re.compile(r'^(-?\d+):(\d+)$')
+_REF_PRIVATE = re.compile(r'^(?:https?://)?t\.me/c/(\d+)/(\d+)/?$')
+_REF_PUBLIC = re.compile(r'^(?:https?://)?t\.me/(\w+)/(\d+)/?$')
+
+
+# Kanal xabariga havolani (chat_id, message_id) ga aylantirish, bo'lmasa None
+def parse_message_ref(value: str):
+    value = (value or '').strip()
+    match = _REF_ID.match(value)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    match = _REF_PRIVATE.match(value)
+    if match:
+        return int(f"-100{match.group(1)}"), int(match.group(2))
+    match = _REF_PUBLIC.match(value)
+    if match:
+        return f"@{match.group(1)}", int(match.group(2))
+    return None
+
+
+# Admin kiritgan file_id uchun boshlang'ich tur (havola bo'lsa copy, aks holda noma'lum)
+def guess_media_type(file_id: str):
+    return 'copy' if parse_message_ref(file_id) else None
+
+
+def _is_media_error(message: str) -> bool:
+    message = message.lower()
+    return any(err in message for err in _MEDIA_ERRORS)
+
+
+# Kinoni to'g'ri usul bilan yuborish; turi birinchi muvaffaqiyatda saqlanadi,
+# yaroqsiz file_id lar belgilanadi va keyingi so'rovlarda API ga murojaat qilinmaydi
+class MovieSender:
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+
+    async def _dispatch(self, media_type: str, chat_id: int, file_id: str, caption: str):
+        if media_type == 'video':
+            await self.bot.send_video(chat_id=chat_id, video=file_id, caption=caption)
+        elif media_type == 'document':
+            await self.bot.send_document(chat_id=chat_id, document=file_id, caption=caption)
+        elif media_type == 'animation':
+            await self.bot.send_animation(chat_id=chat_id, animation=file_id, caption=caption)
+        else:
+            ref = parse_message_ref(file_id)
+            if ref is None:
+                raise TelegramBadRequest(method=None, message="message to copy not found: noto'g'ri havola")
+            await self.bot.copy_message(chat_id=chat_id, from_chat_id=ref[0], message_id=ref[1], caption=caption)
+
+    # True — yuborildi, False — fayl yaroqsiz (kino "broken" deb belgilangan).
+    # Tarmoq/foydalanuvchi xatolari chaqiruvchiga o'tkaziladi.
+    async def send(self, chat_id: int, movie, caption: str) -> bool:
+        if movie.broken:
+            return False
+        if movie.media_type in MEDIA_TYPES:
+            candidates = [movie.media_type]
+        elif parse_message_ref(movie.file_id):
+            # turi saqlanmagan (eski/import qilingan) havola — faqat nusxa olish mumkin
+            candidates = ['copy']
+        else:
+            candidates = list(_GUESS_ORDER)
+        error = None
+        i = 0
+        while i < len(candidates):
+            media_type = candidates[i]
+            i += 1
+            try:
+                await self._dispatch(media_type, chat_id, movie.file_id, caption)
+            except TelegramBadRequest as e:
+                if not _is_media_error(e.message):
+                    raise
+                error = e.message
+                # xatoda ko'rsatilgan turni navbatdagi urinishga qo'yish
+                match = _FILE_TYPE.search(e.message)
+                actual = match.group(1).lower() if match else None
+                if actual in MEDIA_TYPES and actual not in candidates:
+                    candidates.insert(i, actual)
+                continue
+            if media_type != movie.media_type:
+                await self.db.set_movie_media(movie.code, media_type)
+            return True
+        logger.warning("Kino #%s fayli yaroqsiz: %s", movie.code, error)
+        await self.db.mark_movie_broken(movie.code, error or "yuborilmadi")
+        return False
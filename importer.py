@@ -0,0 +1,55 @@
+import csv
+import json
+
+FIELDS = ('title', 'format', 'language', 'file_id')
+
+
+def _check(row, where: str) -> tuple:
+    values = tuple(str(v).strip() if v is not None else '' for v in row)
+    if len(values) != len(FIELDS):
+        raise ValueError(f"{where}: 4 ta maydon kerak (title | format | language | file_id)")
+    if not values[0] or not values[3]:
+        raise ValueError(f"{where}: title va file_id bo'sh bo'lmasligi kerak")
+    return values
+
+
+# JSON: [{"title": ..., "format": ..., "language": ..., "file_id": ...}, ...] yoki [[...], ...]
+def _parse_json(text: str) -> list:
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("JSON ro'yxat (massiv) bo'lishi kerak")
+    movies = []
+    for i, item in enumerate(data, 1):
+        if isinstance(item, dict):
+            item = [item.get(field) for field in FIELDS]
+        movies.append(_check(item, f"{i}-element"))
+    return movies
+
+
+# CSV/matn: har qatorda "title | format | language | file_id" (yoki vergul bilan)
+def _parse_lines(text: str) -> list:
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    delimiter = '|' if '|' in lines[0] else ','
+    movies = []
+    for i, row in enumerate(csv.reader(lines, delimiter=delimiter, skipinitialspace=True), 1):
+        # sarlavha qatorini o'tkazib yuborish
+        if i == 1 and row and row[0].strip().lower() == 'title':
+            continue
+        movies.append(_check(row, f"{i}-qator"))
+    return movies
+
+
+# Yuklangan fayldan kinolar ro'yxatini olish
+def parse_movies(data: bytes, filename: str = '') -> list:
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("Fayl UTF-8 kodirovkada bo'lishi kerak")
+    if filename.lower().endswith('.json') or text.lstrip().startswith('['):
+        try:
+            return _parse_json(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON xato: {e}")
+    return _parse_lines(text)
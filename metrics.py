@@ -0,0 +1,211 @@
+import contextvars
+import inspect
+import logging
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Kechikish chegaralari (soniya) va bitta update dagi so'rovlar soni uchun chegaralar
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+# Joriy update da bajarilgan baza so'rovlari (HandlerMetricsMiddleware o'rnatadi)
+_update_queries = contextvars.ContextVar('update_queries', default=None)
+
+
+# Prometheus uslubidagi gistogramma (kumulyativ bo'lmagan hisoblagichlar, chiqarishda yig'iladi)
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Chegaralar ichida chiziqli interpolyatsiya bilan taxminiy kvantil
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Jarayon ichidagi metrikalar: hisoblagichlar, gistogrammalar va so'ralganda hisoblanadigan gaugelar
+class Metrics:
+    def __init__(self, prefix: str = 'kino'):
+        self.prefix = prefix
+        # nom -> [turi, izoh, label nomlari, chegaralar, {label qiymatlari: qiymat}]
+        self._families = {}
+        # nom -> (izoh, fn)
+        self._gauges = {}
+
+    def counter(self, name: str, help: str, labels: tuple = ()):
+        self._families[name] = ['counter', help, labels, None, {}]
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self._families[name] = ['histogram', help, labels, buckets, {}]
+
+    def gauge(self, name: str, help: str, fn):
+        self._gauges[name] = (help, fn)
+
+    def inc(self, name: str, *labels, value: float = 1):
+        series = self._families[name][4]
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, value: float, *labels):
+        family = self._families[name]
+        histogram = family[4].get(labels)
+        if histogram is None:
+            histogram = family[4][labels] = Histogram(family[3])
+        histogram.observe(value)
+
+    # {label qiymatlari: qiymat yoki Histogram}
+    def series(self, name: str) -> dict:
+        return self._families[name][4]
+
+    def gauges(self) -> dict:
+        values = {}
+        for name, (_, fn) in self._gauges.items():
+            try:
+                values[name] = fn()
+            except Exception:
+                logger.exception("Gauge %s hisoblanmadi", name)
+        return values
+
+    # Prometheus text exposition formati (0.0.4)
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, label_names, _, series) in self._families.items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            for values, value in series.items():
+                if kind == 'counter':
+                    lines.append(f"{full}{_labels(label_names, values)} {value}")
+                    continue
+                cumulative = 0
+                for bound, n in zip(value.buckets, value.counts):
+                    cumulative += n
+                    le = f'le="{bound}"'
+                    lines.append(f"{full}_bucket{_labels(label_names, values, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{full}_bucket{_labels(label_names, values, le)} {value.count}")
+                lines.append(f"{full}_sum{_labels(label_names, values)} {value.sum}")
+                lines.append(f"{full}_count{_labels(label_names, values)} {value.count}")
+        for name, value in self.gauges().items():
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {self._gauges[name][0]}")
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # Qisqa matnli hisobot (admin /metrics va davriy log uchun)
+    def summary(self, top: int = 8) -> str:
+        lines = ["⏱ Handlerlar (soni, p50/p99 ms, xatolar):"]
+        handlers = sorted(self.series('handler_seconds').items(), key=lambda kv: -kv[1].count)
+        errors = self.series('handler_errors_total')
+        for (name,), h in handlers[:top]:
+            lines.append(
+                f"  {name}: {h.count}, {h.quantile(0.5) * 1000:.1f}/{h.quantile(0.99) * 1000:.1f}, "
+                f"{errors.get((name,), 0)}"
+            )
+        queries = self.series('db_queries_per_update').values()
+        updates = sum(h.count for h in queries)
+        if updates:
+            lines.append(f"🗄 Bir update ga baza so'rovlari: {sum(h.sum for h in queries) / updates:.2f}")
+        lines.append("🗄 Baza (chaqiruvlar, o'rtacha ms, jami s):")
+        methods = sorted(self.series('db_seconds').items(), key=lambda kv: -kv[1].sum)
+        for (name,), h in methods[:top]:
+            lines.append(f"  {name}: {h.count}, {h.sum / h.count * 1000:.2f}, {h.sum:.1f}")
+        lines.append("📡 Telegram API (chaqiruvlar, o'rtacha ms, xatolar):")
+        api_errors = {}
+        for (method, _), n in self.series('api_errors_total').items():
+            api_errors[method] = api_errors.get(method, 0) + n
+        calls = sorted(self.series('api_seconds').items(), key=lambda kv: -kv[1].count)
+        for (name,), h in calls[:top]:
+            lines.append(f"  {name}: {h.count}, {h.sum / h.count * 1000:.1f}, {api_errors.get(name, 0)}")
+        retries = self.series('api_retries_total')
+        if retries:
+            lines.append("🔁 Qayta urinishlar: " + ", ".join(f"{r}: {n}" for (r,), n in retries.items()))
+        for name, value in self.gauges().items():
+            lines.append(f"📈 {name}: {value}")
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
+metrics.histogram('handler_seconds', "Handler bajarilish vaqti", ('handler',))
+metrics.counter('handler_errors_total', "Handlerdagi ushlanmagan xatolar", ('handler',))
+metrics.histogram('db_queries_per_update', "Bitta update dagi baza so'rovlari", ('handler',), COUNT_BUCKETS)
+metrics.histogram('db_seconds', "Database metodlari bajarilish vaqti", ('method',))
+metrics.counter('db_queries_total', "SQLite ulanishidan foydalanishlar", ('kind',))
+metrics.counter('db_errors_total', "Database metodlaridagi xatolar", ('method',))
+metrics.histogram('api_seconds', "Telegram API so'rovlari vaqti", ('method',))
+metrics.counter('api_errors_total', "Telegram API xatolari", ('method', 'error'))
+metrics.counter('api_retries_total', "Telegram API ga qayta urinishlar", ('reason',))
+
+
+# Bitta update uchun baza so'rovlari hisoblagichi (HandlerMetricsMiddleware ichida)
+def start_update():
+    counter = [0]
+    return counter, _update_queries.set(counter)
+
+
+def finish_update(token):
+    _update_queries.reset(token)
+
+
+# Database ni o'rash: ochiq metodlar vaqti/xatolari va har bir ulanishdan foydalanish.
+# Ulanish (_read/_write/_flush_writer) odatda bitta SQL so'rovga to'g'ri keladi; keshdan qaytgan
+# chaqiruvlar so'rov hisoblanmaydi.
+def instrument_database(db, registry: Metrics = metrics):
+    def timed(name, fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                registry.inc('db_errors_total', name)
+                raise
+            finally:
+                registry.observe('db_seconds', time.perf_counter() - start, name)
+        return wrapper
+
+    def counted(kind, cm):
+        def wrapper(*args, **kwargs):
+            registry.inc('db_queries_total', kind)
+            counter = _update_queries.get()
+            if counter is not None:
+                counter[0] += 1
+            return cm(*args, **kwargs)
+        return wrapper
+
+    # faqat klass metodlari (on_new_users kabi instance atributlari — baza emas)
+    for name, _ in inspect.getmembers(type(db), inspect.iscoroutinefunction):
+        if not name.startswith('_'):
+            setattr(db, name, timed(name, getattr(db, name)))
+    db._read = counted('read', db._read)
+    db._write = counted('write', db._write)
+    db._flush_writer = counted('write', db._flush_writer)
+    return db
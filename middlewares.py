@@ -0,0 +1,167 @@
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Message, CallbackQuery
+
+from config import (
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_ADMIN_RATE, THROTTLE_ADMIN_BURST,
+    THROTTLE_DEBOUNCE, THROTTLE_NOTICE_WINDOW, THROTTLE_MAX_USERS, THROTTLE_IDLE_TTL,
+)
+from metrics import metrics, start_update, finish_update
+
+
+class _UserState:
+    __slots__ = ('tokens', 'updated', 'last_key', 'last_key_at', 'notified_at')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.last_key = None
+        self.last_key_at = 0.0
+        self.notified_at = 0.0
+
+
+# Har bir foydalanuvchi uchun token bucket, takroriy so'rovlarni tashlab yuborish
+# va "sekinroq" ogohlantirishini oynada bir marta yuborish
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, is_admin, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 admin_rate: float = THROTTLE_ADMIN_RATE, admin_burst: float = THROTTLE_ADMIN_BURST,
+                 debounce: float = THROTTLE_DEBOUNCE, notice_window: float = THROTTLE_NOTICE_WINDOW,
+                 max_users: int = THROTTLE_MAX_USERS, idle_ttl: float = THROTTLE_IDLE_TTL):
+        self.is_admin = is_admin
+        self.rate = rate
+        self.burst = burst
+        self.admin_rate = admin_rate
+        self.admin_burst = admin_burst
+        self.debounce = debounce
+        self.notice_window = notice_window
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        # oxirgi faollik bo'yicha tartiblangan — boshida eng uzoq jim turganlar
+        self._users = OrderedDict()
+        self.dropped = 0
+
+    def _state(self, user_id: int, now: float, burst: float) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(burst, now)
+        else:
+            self._users.move_to_end(user_id)
+        # uzoq jim turgan va ortiqcha yozuvlarni chiqarib yuborish
+        while self._users:
+            oldest_id, oldest = next(iter(self._users.items()))
+            if oldest_id == user_id:
+                break
+            if len(self._users) <= self.max_users and now - oldest.updated < self.idle_ttl:
+                break
+            self._users.popitem(last=False)
+        return state
+
+    @staticmethod
+    def _event_key(event):
+        if isinstance(event, Message):
+            if event.text or event.caption:
+                return 'm', event.text or event.caption
+            return None
+        if isinstance(event, CallbackQuery):
+            return 'c', event.data
+        return None
+
+    async def _notify(self, event):
+        try:
+            if isinstance(event, Message):
+                await event.answer("⏳ Juda tez yuboryapsiz, biroz kuting.")
+            elif isinstance(event, CallbackQuery):
+                await event.answer("⏳ Biroz kuting.", show_alert=False)
+        except Exception:
+            pass
+
+    # Tashlab yuborilgan tugma bosilishiga jimgina javob (aks holda Telegram soatchasi aylanib turadi)
+    @staticmethod
+    async def _dismiss(event):
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer()
+            except Exception:
+                pass
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+        admin = await self.is_admin(user.id)
+        rate, burst = (self.admin_rate, self.admin_burst) if admin else (self.rate, self.burst)
+        now = time.monotonic()
+        state = self._state(user.id, now, burst)
+
+        # bir xil so'rovning tez takrorlanishi (masalan, bitta kodni ketma-ket yuborish)
+        key = self._event_key(event)
+        if key is not None and key == state.last_key and now - state.last_key_at < self.debounce:
+            self.dropped += 1
+            await self._dismiss(event)
+            return None
+
+        state.tokens = min(burst, state.tokens + (now - state.updated) * rate)
+        state.updated = now
+        if state.tokens < 1:
+            self.dropped += 1
+            if now - state.notified_at >= self.notice_window:
+                state.notified_at = now
+                await self._notify(event)
+            else:
+                await self._dismiss(event)
+            return None
+        state.tokens -= 1
+        state.last_key, state.last_key_at = key, now
+        return await handler(event, data)
+
+
+# Har bir foydalanuvchi faolligini qayd etish (kunlik faol foydalanuvchilar statistikasi)
+class ActivityMiddleware(BaseMiddleware):
+    def __init__(self, db):
+        self.db = db
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is not None:
+            self.db.record_activity(user.id)
+        return await handler(event, data)
+
+
+# Handler kechikishi, xatolari va bitta update dagi baza so'rovlari (routerlarga ichki middleware)
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, registry=metrics):
+        self.registry = registry
+
+    async def __call__(self, handler, event, data):
+        name = getattr(data['handler'].callback, '__name__', 'handler')
+        queries, token = start_update()
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.registry.inc('handler_errors_total', name)
+            raise
+        finally:
+            self.registry.observe('handler_seconds', time.perf_counter() - start, name)
+            self.registry.observe('db_queries_per_update', queries[0], name)
+            finish_update(token)
+
+
+# Telegram API chaqiruvlari: vaqt va xato turlari (bot.session ga ulanadi)
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    def __init__(self, registry=metrics):
+        self.registry = registry
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.registry.inc('api_errors_total', name, type(e).__name__)
+            raise
+        finally:
+            self.registry.observe('api_seconds', time.perf_counter() - start, name)
@@ -0,0 +1,322 @@
+# Sxema migratsiyalari. Versiya PRAGMA user_version da saqlanadi;
+# har bir qadam o'z tranzaksiyasida bajariladi va takror ishga tushirilsa ham xavfsiz
+# (eski, versiyasiz bazalar ham 0-versiyadan boshlab to'g'ri yangilanadi).
+
+
+# Jadvalga ustun qo'shish (agar hali yo'q bo'lsa)
+async def add_column(db, table: str, column: str, definition: str):
+    cursor = await db.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in await cursor.fetchall()]:
+        await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+# 1: asosiy jadvallar
+async def _base_tables(db):
+    # Foydalanuvchilar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            fullname TEXT,
+            joined_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Kinolar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS movies (
+            code INTEGER PRIMARY KEY,
+            title TEXT,
+            format TEXT,
+            language TEXT,
+            file_id TEXT,
+            views INTEGER DEFAULT 0,
+            is_deleted INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Kanallar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            username TEXT PRIMARY KEY
+        )
+    ''')
+
+    # Reklamalar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_file_id TEXT,
+            text TEXT,
+            button_text TEXT,
+            button_url TEXT,
+            schedule_time TEXT,
+            repeat_count INTEGER
+        )
+    ''')
+
+    # Adminlar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+    # Sozlamalar jadvali
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+# 2: ommaviy xabarlar
+async def _broadcasts(db):
+    # Ommaviy xabarlar jadvali (qayta ishga tushganda davom ettirish uchun)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT,
+            admin_chat_id INTEGER,
+            progress_message_id INTEGER,
+            status TEXT DEFAULT 'running',
+            last_user_id INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    # Botni bloklagan foydalanuvchilar belgisi
+    await add_column(db, 'users', 'is_blocked', 'INTEGER DEFAULT 0')
+
+
+# 3: to'liq matnli qidiruv
+async def _movies_fts(db):
+    # Kinolar bo'yicha to'liq matnli qidiruv (FTS5, movies jadvali bilan triggerlar orqali sinxron)
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'movies_fts'")
+    fts_exists = await cursor.fetchone() is not None
+    await db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title, language, format,
+            content='movies', content_rowid='code',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_ai AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title, language, format)
+            VALUES (new.code, new.title, new.language, new.format);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_ad AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, language, format)
+            VALUES ('delete', old.code, old.title, old.language, old.format);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_au AFTER UPDATE OF title, language, format ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, language, format)
+            VALUES ('delete', old.code, old.title, old.language, old.format);
+            INSERT INTO movies_fts (rowid, title, language, format)
+            VALUES (new.code, new.title, new.language, new.format);
+        END
+    ''')
+    if not fts_exists:
+        # mavjud kinolarni indeksga qo'shish
+        await db.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+
+
+# 4: jarayonlararo kesh hodisalari
+async def _cache_events(db):
+    # Kesh bekor qilish hodisalari (bir nechta bot jarayoni uchun)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS cache_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT,
+            key TEXT,
+            origin TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# 5: so'rovlar shakliga mos indekslar
+async def _indexes(db):
+    # Eng ko'p ko'rilganlar ro'yxati uchun indeks (faqat o'chirilmagan kinolar)
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movies_top
+        ON movies (views DESC, code DESC) WHERE is_deleted = 0
+    ''')
+
+    # get_movie / kinolar soni / kod bo'yicha ro'yxat — faqat o'chirilmagan kinolar
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movies_live
+        ON movies (code) WHERE is_deleted = 0
+    ''')
+
+    # Foydalanuvchilar o'sishi statistikasi (kunlar bo'yicha)
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_joined
+        ON users (joined_date)
+    ''')
+
+    # Ommaviy xabar oluvchilar va faol foydalanuvchilar soni
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_active
+        ON users (id) WHERE is_blocked = 0
+    ''')
+
+
+# 6: hisoblagichlar (get_stats uchun) va kunlik statistika
+async def _counters(db):
+    # Umumiy hisoblagichlar: users, movies (o'chirilmagan), total_views
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await db.execute('''
+        INSERT OR REPLACE INTO counters (name, value) VALUES
+            ('users', (SELECT COUNT(*) FROM users)),
+            ('movies', (SELECT COUNT(*) FROM movies WHERE is_deleted = 0)),
+            ('total_views', (SELECT COALESCE(SUM(views), 0) FROM movies))
+    ''')
+
+    # Kunlik statistika: yangi va faol foydalanuvchilar, ko'rishlar
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            views INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await db.execute('''
+        INSERT OR IGNORE INTO daily_stats (day, new_users)
+        SELECT date(joined_date), COUNT(*) FROM users
+        WHERE joined_date IS NOT NULL GROUP BY date(joined_date)
+    ''')
+
+    # Kunlik faol foydalanuvchilar (har bir foydalanuvchi kuniga bir marta)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            day TEXT,
+            user_id INTEGER,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Har bir kinoning kunlik ko'rishlari
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS movie_daily_views (
+            day TEXT,
+            code INTEGER,
+            views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, code)
+        ) WITHOUT ROWID
+    ''')
+
+    # Foydalanuvchilar soni va kunlik yangi foydalanuvchilar
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_counter_ai AFTER INSERT ON users BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'users';
+            INSERT INTO daily_stats (day, new_users) VALUES (date('now'), 1)
+            ON CONFLICT(day) DO UPDATE SET new_users = new_users + 1;
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_counter_ad AFTER DELETE ON users BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'users';
+        END
+    ''')
+
+    # O'chirilmagan kinolar soni
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_counter_ai AFTER INSERT ON movies BEGIN
+            UPDATE counters SET value = value + (COALESCE(new.is_deleted, 0) = 0) WHERE name = 'movies';
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_counter_ad AFTER DELETE ON movies BEGIN
+            UPDATE counters SET value = value - (COALESCE(old.is_deleted, 0) = 0) WHERE name = 'movies';
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_counter_au AFTER UPDATE OF is_deleted ON movies BEGIN
+            UPDATE counters
+            SET value = value + (COALESCE(new.is_deleted, 0) = 0) - (COALESCE(old.is_deleted, 0) = 0)
+            WHERE name = 'movies';
+        END
+    ''')
+
+
+# 7: foydalanuvchining oxirgi faolligi
+async def _users_last_seen(db):
+    await add_column(db, 'users', 'last_seen', 'TIMESTAMP')
+    # faollik avval kuzatilmagan — hammaga yangilanish vaqtidan boshlab imkon beriladi
+    # (joined_date dan olinsa, eski foydalanuvchilar birinchi archive_users da arxivlanardi)
+    await db.execute('UPDATE users SET last_seen = CURRENT_TIMESTAMP WHERE last_seen IS NULL')
+
+
+# 8: kino fayli turi (yuborish usuli) va yaroqsiz file_id belgisi
+async def _movies_media(db):
+    # media_type: video | document | animation | copy, NULL — hali aniqlanmagan
+    await add_column(db, 'movies', 'media_type', 'TEXT')
+    # broken: oxirgi xato matni, NULL — fayl yaroqli
+    await add_column(db, 'movies', 'broken', 'TEXT')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_movies_broken ON movies (code) WHERE broken IS NOT NULL')
+
+
+# 9: arxiv jadvallari (o'chirilgan kinolar, bloklagan/uzoq faol bo'lmagan foydalanuvchilar)
+async def _archive(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS movies_archive (
+            code INTEGER PRIMARY KEY,
+            title TEXT,
+            format TEXT,
+            language TEXT,
+            file_id TEXT,
+            views INTEGER,
+            media_type TEXT,
+            broken TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users_archive (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            fullname TEXT,
+            joined_date TIMESTAMP,
+            last_seen TIMESTAMP,
+            is_blocked INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # arxivlash uchun nomzodlarni bo'laklab topish
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_movies_deleted ON movies (code) WHERE is_deleted = 1')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_users_blocked ON users (id) WHERE is_blocked = 1')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen)')
+
+
+# (versiya, qadam) — yangi migratsiyalar faqat oxiriga qo'shiladi
+MIGRATIONS = [
+    (1, _base_tables),
+    (2, _broadcasts),
+    (3, _movies_fts),
+    (4, _cache_events),
+    (5, _indexes),
+    (6, _counters),
+    (7, _users_last_seen),
+    (8, _movies_media),
+    (9, _archive),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
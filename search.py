@@ -0,0 +1,56 @@
+import re
+
+# O'zbek kirill -> lotin
+_CYR_TO_LAT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 's',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': "o'", 'қ': 'q', 'ғ': "g'", 'ҳ': 'h',
+}
+
+# O'zbek lotin -> kirill (avval ikki harfli birikmalar)
+_LAT_TO_CYR = [
+    ("o'", 'ў'), ("g'", 'ғ'), ('sh', 'ш'), ('ch', 'ч'), ('yo', 'ё'), ('yu', 'ю'), ('ya', 'я'),
+    ('a', 'а'), ('b', 'б'), ('c', 'с'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'ҳ'),
+    ('i', 'и'), ('j', 'ж'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'),
+    ('p', 'п'), ('q', 'қ'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'),
+    ('x', 'х'), ('y', 'й'), ('z', 'з'),
+]
+
+# Turli apostrof belgilarini bittaga keltirish (o‘, oʻ, o` -> o')
+_APOSTROPHES = re.compile(r"[‘’ʻʼ`´]")
+_WORD = re.compile(r'\w+')
+
+
+def _normalize(text: str) -> str:
+    return _APOSTROPHES.sub("'", text.lower())
+
+
+def to_latin(text: str) -> str:
+    return ''.join(_CYR_TO_LAT.get(ch, ch) for ch in _normalize(text))
+
+
+def to_cyrillic(text: str) -> str:
+    text = _normalize(text)
+    for lat, cyr in _LAT_TO_CYR:
+        text = text.replace(lat, cyr)
+    return text
+
+
+# Qidiruv so'rovini tozalash (callback_data uchun ham xavfsiz)
+def clean_query(query: str) -> str:
+    return ' '.join(_WORD.findall(_normalize(query)))
+
+
+# FTS5 MATCH ifodasi: har bir so'z prefiks bo'yicha (AND), kirill/lotin variantlari OR bilan
+def build_match_query(query: str) -> str:
+    groups = []
+    for variant in (query, to_latin(query), to_cyrillic(query)):
+        words = _WORD.findall(_normalize(variant))
+        if not words:
+            continue
+        group = ' AND '.join(f'"{w}"*' for w in words)
+        if group not in groups:
+            groups.append(group)
+    return ' OR '.join(f'({g})' for g in groups)
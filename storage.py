@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_DATABASE_FILE, REDIS_URL, DB_BUSY_TIMEOUT_MS
+
+
+# FSM holatlarini SQLite faylida saqlash (qayta ishga tushganda yo'qolmaydi,
+# bir nechta jarayon bitta faylni ishlatishi mumkin)
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db_file: str = FSM_DATABASE_FILE):
+        self.db_file = db_file
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._conn is None:
+            conn = await aiosqlite.connect(self.db_file)
+            await conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+            await conn.execute('PRAGMA journal_mode = WAL')
+            await conn.execute('PRAGMA synchronous = NORMAL')
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_storage (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT
+                )
+            ''')
+            await conn.commit()
+            self._conn = conn
+        return self._conn
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        async with self._lock:
+            conn = await self._connection()
+            await conn.execute(
+                '''INSERT INTO fsm_storage (key, state) VALUES (?, ?)
+                   ON CONFLICT(key) DO UPDATE SET state = excluded.state''',
+                (self.key_builder.build(key), value)
+            )
+            await conn.commit()
+
+    async def get_state(self, key: StorageKey):
+        async with self._lock:
+            conn = await self._connection()
+            cursor = await conn.execute('SELECT state FROM fsm_storage WHERE key = ?', (self.key_builder.build(key),))
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        async with self._lock:
+            conn = await self._connection()
+            await conn.execute(
+                '''INSERT INTO fsm_storage (key, data) VALUES (?, ?)
+                   ON CONFLICT(key) DO UPDATE SET data = excluded.data''',
+                (self.key_builder.build(key), json.dumps(dict(data), ensure_ascii=False))
+            )
+            await conn.commit()
+
+    async def get_data(self, key: StorageKey) -> dict:
+        async with self._lock:
+            conn = await self._connection()
+            cursor = await conn.execute('SELECT data FROM fsm_storage WHERE key = ?', (self.key_builder.build(key),))
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+# FSM_STORAGE bo'yicha saqlash joyini tanlash: memory | sqlite | redis
+def create_storage() -> BaseStorage:
+    if FSM_STORAGE == 'sqlite':
+        return SQLiteStorage()
+    if FSM_STORAGE == 'redis':
+        # Redis (yoki unga mos: Valkey, KeyDB, lokal stand-in) — "pip install redis" kerak
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("FSM_STORAGE=redis uchun 'redis' paketini o'rnating")
+        return RedisStorage.from_url(REDIS_URL)
+    return MemoryStorage()
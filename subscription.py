@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+from cache import TTLCache, MISSING
+from config import SUB_CACHE_TTL, SUB_CACHE_NEGATIVE_TTL, SUB_CACHE_MAXSIZE
+
+logger = logging.getLogger(__name__)
+
+
+# Majburiy obuna tekshiruvi: (user, kanal) natijalari keshlanadi,
+# keshda yo'q kanallar bir vaqtda (parallel) tekshiriladi
+class SubscriptionChecker:
+    def __init__(self, bot, db):
+        self.bot = bot
+        self.db = db
+        self._cache = TTLCache(SUB_CACHE_TTL, maxsize=SUB_CACHE_MAXSIZE)
+
+    async def _is_member(self, channel: str, user_id: int) -> bool:
+        try:
+            member = await self.bot.get_chat_member(f"@{channel}", user_id)
+        except Exception as e:
+            # agar kanalni tekshirishda xato bo'lsa, foydalanuvchini to'xtatmaymiz; natija qisqa muddat
+            # keshlanadi — noto'g'ri sozlangan kanal har bir xabarda API so'rovi yubormasin
+            logger.warning("Kanal @%s tekshirilmadi: %s", channel, e)
+            self._cache.set((user_id, channel), True, ttl=SUB_CACHE_NEGATIVE_TTL)
+            return True
+        ok = member.status not in ('left', 'kicked')
+        self._cache.set((user_id, channel), ok, ttl=SUB_CACHE_TTL if ok else SUB_CACHE_NEGATIVE_TTL)
+        return ok
+
+    # Foydalanuvchi obuna bo'lmagan kanallar ro'yxati (bo'sh — hammasi joyida)
+    # fresh=True — "Tekshirish" tugmasi uchun: salbiy natijalar qayta so'raladi
+    async def missing_channels(self, user_id: int, fresh: bool = False) -> list:
+        if await self.db.get_setting('force_subscribe') != 'true':
+            return []
+        channels = await self.db.get_channels()
+        missing, to_check = [], []
+        for ch in channels:
+            cached = self._cache.get((user_id, ch))
+            if cached is MISSING or (fresh and not cached):
+                to_check.append(ch)
+            elif not cached:
+                missing.append(ch)
+        if to_check:
+            results = await asyncio.gather(*(self._is_member(ch, user_id) for ch in to_check))
+            missing.extend(ch for ch, ok in zip(to_check, results) if not ok)
+        return missing